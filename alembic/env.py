@@ -1,5 +1,6 @@
 from logging.config import fileConfig
 
+from app import config as app_config
 from app.database import Base
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
@@ -15,6 +16,9 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# migrate the database the app is configured for, not the one in alembic.ini
+config.set_main_option("sqlalchemy.url", app_config.DATABASE_URL.replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
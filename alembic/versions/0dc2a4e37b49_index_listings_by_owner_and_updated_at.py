@@ -0,0 +1,26 @@
+"""Index listings by owner and updated_at for owner exports
+
+Revision ID: 0dc2a4e37b49
+Revises: d3d581603b4b
+Create Date: 2026-10-18 21:34:15.902471
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0dc2a4e37b49'
+down_revision: Union[str, None] = 'd3d581603b4b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_listings_user_id_updated_at_id', 'listings', ['user_id', 'updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_listings_user_id_updated_at_id', table_name='listings')
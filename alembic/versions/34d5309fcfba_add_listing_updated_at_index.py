@@ -0,0 +1,26 @@
+"""Add listing updated_at index for incremental exports
+
+Revision ID: 34d5309fcfba
+Revises: 834539ba66a4
+Create Date: 2026-10-18 18:41:12.503917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '34d5309fcfba'
+down_revision: Union[str, None] = '834539ba66a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_listings_updated_at_id', 'listings', ['updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_listings_updated_at_id', table_name='listings')
@@ -0,0 +1,29 @@
+"""Index comments by (listing_id, created_at, id) for paginated threads
+
+Revision ID: 4051e37d1f92
+Revises: 50df33205489
+Create Date: 2026-10-18 16:48:30.917455
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4051e37d1f92'
+down_revision: Union[str, None] = '50df33205489'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the composite index also serves every plain listing_id lookup
+    op.create_index('ix_comments_listing_id_created_at', 'comments', ['listing_id', 'created_at', 'id'], unique=False)
+    op.drop_index('ix_comments_listing_id', table_name='comments')
+
+
+def downgrade() -> None:
+    op.create_index('ix_comments_listing_id', 'comments', ['listing_id'], unique=False)
+    op.drop_index('ix_comments_listing_id_created_at', table_name='comments')
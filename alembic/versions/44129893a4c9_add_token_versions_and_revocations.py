@@ -0,0 +1,43 @@
+"""Add user token versions and token revocations
+
+Revision ID: 44129893a4c9
+Revises: 5672049e6470
+Create Date: 2026-10-18 21:12:45.904113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '44129893a4c9'
+down_revision: Union[str, None] = '5672049e6470'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+    op.create_table(
+        'token_revocations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('jti', sa.String(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('token_version', sa.Integer(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sqlite_autoincrement=True,
+    )
+    op.create_index('ix_token_revocations_expires_at', 'token_revocations', ['expires_at'], unique=False)
+    op.create_index('ix_token_revocations_jti', 'token_revocations', ['jti'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_token_revocations_jti', table_name='token_revocations')
+    op.drop_index('ix_token_revocations_expires_at', table_name='token_revocations')
+    op.drop_table('token_revocations')
+    # plain DROP COLUMN (SQLite >= 3.35): a batch table rebuild would drop the triggers
+    op.drop_column('users', 'token_version')
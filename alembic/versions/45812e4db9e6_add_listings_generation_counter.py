@@ -0,0 +1,44 @@
+"""Add listings generation counter
+
+Revision ID: 45812e4db9e6
+Revises: 5d6852a6c8a4
+Create Date: 2026-10-18 22:41:27.603918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '45812e4db9e6'
+down_revision: Union[str, None] = '5d6852a6c8a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BUMP = "UPDATE listings_generation SET generation = generation + 1; "
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS listings_generation (id INTEGER PRIMARY KEY CHECK (id = 1), "
+        "generation INTEGER NOT NULL)"
+    )
+    op.execute("INSERT OR IGNORE INTO listings_generation VALUES (1, 0)")
+    op.execute(f"CREATE TRIGGER listings_generation_ai AFTER INSERT ON listings BEGIN {BUMP}END")
+    op.execute(f"CREATE TRIGGER listings_generation_ad AFTER DELETE ON listings BEGIN {BUMP}END")
+    op.execute(
+        "CREATE TRIGGER listings_generation_au AFTER UPDATE OF "
+        "type, rooms_count, price, latitude, longitude, address, description ON listings "
+        "WHEN old.type IS NOT new.type OR old.rooms_count IS NOT new.rooms_count OR old.price IS NOT new.price "
+        "OR old.latitude IS NOT new.latitude OR old.longitude IS NOT new.longitude "
+        f"OR old.address IS NOT new.address OR old.description IS NOT new.description BEGIN {BUMP}END"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS listings_generation_au")
+    op.execute("DROP TRIGGER IF EXISTS listings_generation_ad")
+    op.execute("DROP TRIGGER IF EXISTS listings_generation_ai")
+    op.execute("DROP TABLE IF EXISTS listings_generation")
@@ -0,0 +1,69 @@
+"""Add denormalized comments_count to listings
+
+Revision ID: 50df33205489
+Revises: e4ced911f352
+Create Date: 2026-10-18 15:37:12.264019
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '50df33205489'
+down_revision: Union[str, None] = 'e4ced911f352'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('listings', sa.Column('comments_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        "UPDATE listings SET comments_count = "
+        "(SELECT count(*) FROM comments WHERE comments.listing_id = listings.id)"
+    )
+    # the revision triggers are replaced by ones that also maintain the counter
+    op.execute("DROP TRIGGER comments_revision_ad")
+    op.execute("DROP TRIGGER comments_revision_au")
+    op.execute("DROP TRIGGER comments_revision_ai")
+    op.execute(
+        "CREATE TRIGGER comments_listing_ai AFTER INSERT ON comments BEGIN "
+        "UPDATE listings SET comments_count = comments_count + 1, revision = revision + 1 "
+        "WHERE id = new.listing_id; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER comments_listing_au AFTER UPDATE ON comments BEGIN "
+        "UPDATE listings SET revision = revision + 1 WHERE id = new.listing_id; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER comments_listing_ad AFTER DELETE ON comments BEGIN "
+        "UPDATE listings SET comments_count = comments_count - 1, revision = revision + 1 "
+        "WHERE id = old.listing_id; "
+        "END"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER comments_listing_ad")
+    op.execute("DROP TRIGGER comments_listing_au")
+    op.execute("DROP TRIGGER comments_listing_ai")
+    op.execute(
+        "CREATE TRIGGER comments_revision_ai AFTER INSERT ON comments BEGIN "
+        "UPDATE listings SET revision = revision + 1 WHERE id = new.listing_id; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER comments_revision_au AFTER UPDATE ON comments BEGIN "
+        "UPDATE listings SET revision = revision + 1 WHERE id = new.listing_id; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER comments_revision_ad AFTER DELETE ON comments BEGIN "
+        "UPDATE listings SET revision = revision + 1 WHERE id = old.listing_id; "
+        "END"
+    )
+    op.drop_column('listings', 'comments_count')
@@ -0,0 +1,40 @@
+"""Add indexes for listing search, comments and favorites lookups
+
+Revision ID: 515c7b77afe0
+Revises: bbdec3e7ea00
+Create Date: 2026-10-18 09:12:40.118273
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '515c7b77afe0'
+down_revision: Union[str, None] = 'bbdec3e7ea00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_listings_created_at_id', 'listings', ['created_at', 'id'], unique=False)
+    op.create_index('ix_listings_type_rooms_count_price', 'listings', ['type', 'rooms_count', 'price'], unique=False)
+    op.create_index('ix_listings_rooms_count_price', 'listings', ['rooms_count', 'price'], unique=False)
+    op.create_index('ix_listings_price', 'listings', ['price'], unique=False)
+    op.create_index('ix_listings_user_id', 'listings', ['user_id'], unique=False)
+    op.create_index('ix_comments_listing_id', 'comments', ['listing_id'], unique=False)
+    op.create_index('ix_comments_author_id', 'comments', ['author_id'], unique=False)
+    op.create_index('ix_favorites_listing_id', 'favorites', ['listing_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_favorites_listing_id', table_name='favorites')
+    op.drop_index('ix_comments_author_id', table_name='comments')
+    op.drop_index('ix_comments_listing_id', table_name='comments')
+    op.drop_index('ix_listings_user_id', table_name='listings')
+    op.drop_index('ix_listings_price', table_name='listings')
+    op.drop_index('ix_listings_rooms_count_price', table_name='listings')
+    op.drop_index('ix_listings_type_rooms_count_price', table_name='listings')
+    op.drop_index('ix_listings_created_at_id', table_name='listings')
@@ -0,0 +1,66 @@
+"""Add listing facet aggregates
+
+Revision ID: 5672049e6470
+Revises: 34d5309fcfba
+Create Date: 2026-10-18 19:04:37.518206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5672049e6470'
+down_revision: Union[str, None] = '34d5309fcfba'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PRICE_EDGES = (
+    50000, 100000, 150000, 200000, 300000, 500000, 1000000,
+    5000000, 10000000, 20000000, 30000000, 50000000, 100000000,
+)
+
+
+def facet_key(row: str) -> str:
+    whens = " ".join(f"WHEN {row}.price < {edge} THEN {i}" for i, edge in enumerate(PRICE_EDGES))
+    return f"{row}.type, coalesce({row}.rooms_count, -1), CASE {whens} ELSE {len(PRICE_EDGES)} END"
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS listing_facets ("
+        "type TEXT NOT NULL, rooms_key INTEGER NOT NULL, price_bucket INTEGER NOT NULL, count INTEGER NOT NULL, "
+        "PRIMARY KEY (type, rooms_key, price_bucket)) WITHOUT ROWID"
+    )
+    op.execute("DELETE FROM listing_facets")
+    op.execute(f"INSERT INTO listing_facets SELECT {facet_key('listings')}, count(*) FROM listings GROUP BY 1, 2, 3")
+    op.execute(
+        "CREATE TRIGGER listing_facets_ai AFTER INSERT ON listings BEGIN "
+        f"INSERT INTO listing_facets VALUES ({facet_key('new')}, 1) "
+        "ON CONFLICT (type, rooms_key, price_bucket) DO UPDATE SET count = count + 1; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER listing_facets_ad AFTER DELETE ON listings BEGIN "
+        "UPDATE listing_facets SET count = count - 1 "
+        f"WHERE (type, rooms_key, price_bucket) = ({facet_key('old')}); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER listing_facets_au AFTER UPDATE OF type, rooms_count, price ON listings "
+        "WHEN old.type IS NOT new.type OR old.rooms_count IS NOT new.rooms_count OR old.price IS NOT new.price BEGIN "
+        "UPDATE listing_facets SET count = count - 1 "
+        f"WHERE (type, rooms_key, price_bucket) = ({facet_key('old')}); "
+        f"INSERT INTO listing_facets VALUES ({facet_key('new')}, 1) "
+        "ON CONFLICT (type, rooms_key, price_bucket) DO UPDATE SET count = count + 1; "
+        "END"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER listing_facets_au")
+    op.execute("DROP TRIGGER listing_facets_ad")
+    op.execute("DROP TRIGGER listing_facets_ai")
+    op.execute("DROP TABLE listing_facets")
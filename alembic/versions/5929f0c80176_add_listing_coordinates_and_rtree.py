@@ -0,0 +1,52 @@
+"""Add listing coordinates and R*Tree spatial index
+
+Revision ID: 5929f0c80176
+Revises: 7e8d956286a2
+Create Date: 2026-10-18 12:41:09.372216
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5929f0c80176'
+down_revision: Union[str, None] = '7e8d956286a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('listings', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('listings', sa.Column('longitude', sa.Float(), nullable=True))
+    op.execute("CREATE VIRTUAL TABLE listings_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)")
+    op.execute(
+        "CREATE TRIGGER listings_rtree_ai AFTER INSERT ON listings "
+        "WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN "
+        "INSERT INTO listings_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER listings_rtree_ad AFTER DELETE ON listings BEGIN "
+        "DELETE FROM listings_rtree WHERE id = old.id; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER listings_rtree_au AFTER UPDATE OF latitude, longitude ON listings BEGIN "
+        "DELETE FROM listings_rtree WHERE id = old.id; "
+        "INSERT INTO listings_rtree SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude "
+        "WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL; "
+        "END"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER listings_rtree_au")
+    op.execute("DROP TRIGGER listings_rtree_ad")
+    op.execute("DROP TRIGGER listings_rtree_ai")
+    op.execute("DROP TABLE listings_rtree")
+    # plain DROP COLUMN (SQLite >= 3.35): a batch table rebuild would drop the FTS triggers
+    op.drop_column('listings', 'longitude')
+    op.drop_column('listings', 'latitude')
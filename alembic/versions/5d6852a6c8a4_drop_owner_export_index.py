@@ -0,0 +1,26 @@
+"""Drop the owner export index
+
+Revision ID: 5d6852a6c8a4
+Revises: 0dc2a4e37b49
+Create Date: 2026-10-18 22:16:05.284137
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d6852a6c8a4'
+down_revision: Union[str, None] = '0dc2a4e37b49'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_index('ix_listings_user_id_updated_at_id', table_name='listings')
+
+
+def downgrade() -> None:
+    op.create_index('ix_listings_user_id_updated_at_id', 'listings', ['user_id', 'updated_at', 'id'], unique=False)
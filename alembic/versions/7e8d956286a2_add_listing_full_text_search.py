@@ -0,0 +1,53 @@
+"""Add FTS5 full-text index over listing address and description
+
+Revision ID: 7e8d956286a2
+Revises: 515c7b77afe0
+Create Date: 2026-10-18 11:03:27.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e8d956286a2'
+down_revision: Union[str, None] = '515c7b77afe0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE VIRTUAL TABLE listings_fts USING fts5("
+        "address, description, content='listings', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "CREATE TRIGGER listings_fts_ai AFTER INSERT ON listings BEGIN "
+        "INSERT INTO listings_fts(rowid, address, description) VALUES (new.id, new.address, new.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER listings_fts_ad AFTER DELETE ON listings BEGIN "
+        "INSERT INTO listings_fts(listings_fts, rowid, address, description) "
+        "VALUES ('delete', old.id, old.address, old.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER listings_fts_au AFTER UPDATE OF address, description ON listings BEGIN "
+        "INSERT INTO listings_fts(listings_fts, rowid, address, description) "
+        "VALUES ('delete', old.id, old.address, old.description); "
+        "INSERT INTO listings_fts(rowid, address, description) VALUES (new.id, new.address, new.description); "
+        "END"
+    )
+    # index the listings that already exist
+    op.execute("INSERT INTO listings_fts(listings_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER listings_fts_au")
+    op.execute("DROP TRIGGER listings_fts_ad")
+    op.execute("DROP TRIGGER listings_fts_ai")
+    op.execute("DROP TABLE listings_fts")
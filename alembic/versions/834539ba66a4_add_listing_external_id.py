@@ -0,0 +1,28 @@
+"""Add listing external_id for idempotent bulk imports
+
+Revision ID: 834539ba66a4
+Revises: 4051e37d1f92
+Create Date: 2026-10-18 18:05:44.620187
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '834539ba66a4'
+down_revision: Union[str, None] = '4051e37d1f92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('listings', sa.Column('external_id', sa.String(), nullable=True))
+    op.create_index('ix_listings_user_id_external_id', 'listings', ['user_id', 'external_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_listings_user_id_external_id', table_name='listings')
+    op.drop_column('listings', 'external_id')
@@ -0,0 +1,27 @@
+"""Drop the redundant listing owner index
+
+Revision ID: 9d7599f086fe
+Revises: 45812e4db9e6
+Create Date: 2026-10-18 22:58:12.471560
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d7599f086fe'
+down_revision: Union[str, None] = '45812e4db9e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ix_listings_user_id_external_id leads with user_id and serves the same lookups
+    op.drop_index('ix_listings_user_id', table_name='listings')
+
+
+def downgrade() -> None:
+    op.create_index('ix_listings_user_id', 'listings', ['user_id'], unique=False)
@@ -0,0 +1,38 @@
+"""Backfill comment created_at
+
+Revision ID: c621eabe5394
+Revises: 9d7599f086fe
+Create Date: 2026-10-18 23:12:44.930217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c621eabe5394'
+down_revision: Union[str, None] = '9d7599f086fe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # undated comments sorted first in the thread; the listing's own date keeps them there
+    op.execute(
+        "UPDATE comments SET created_at = "
+        "(SELECT listings.created_at FROM listings WHERE listings.id = comments.listing_id) "
+        "WHERE created_at IS NULL"
+    )
+    # SQLite can't add NOT NULL to an existing column without rebuilding the table, which
+    # would drop its triggers; this stands in for it (and a server default) on upgraded databases
+    op.execute(
+        "CREATE TRIGGER comments_created_at_ai AFTER INSERT ON comments WHEN new.created_at IS NULL BEGIN "
+        "UPDATE comments SET created_at = strftime('%Y-%m-%d %H:%M:%f000', 'now') WHERE id = new.id; "
+        "END"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER comments_created_at_ai")
@@ -0,0 +1,33 @@
+"""Add listing filter indexes in page order
+
+Revision ID: d3d581603b4b
+Revises: 44129893a4c9
+Create Date: 2026-10-18 21:07:42.318564
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3d581603b4b'
+down_revision: Union[str, None] = '44129893a4c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_listings_type_created_at_id', 'listings', ['type', 'created_at', 'id'], unique=False)
+    op.create_index(
+        'ix_listings_type_rooms_count_created_at_id', 'listings', ['type', 'rooms_count', 'created_at', 'id'],
+        unique=False
+    )
+    op.create_index('ix_listings_rooms_count_created_at_id', 'listings', ['rooms_count', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_listings_rooms_count_created_at_id', table_name='listings')
+    op.drop_index('ix_listings_type_rooms_count_created_at_id', table_name='listings')
+    op.drop_index('ix_listings_type_created_at_id', table_name='listings')
@@ -0,0 +1,48 @@
+"""Add listing revision and updated_at for conditional GETs
+
+Revision ID: e4ced911f352
+Revises: 5929f0c80176
+Create Date: 2026-10-18 14:20:51.806344
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4ced911f352'
+down_revision: Union[str, None] = '5929f0c80176'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('listings', sa.Column('revision', sa.Integer(), server_default='1', nullable=False))
+    # SQLite can only add NOT NULL columns with a constant default; backfill from created_at
+    op.add_column('listings', sa.Column('updated_at', sa.DateTime(), server_default='1970-01-01 00:00:00', nullable=False))
+    op.execute("UPDATE listings SET updated_at = created_at")
+    op.execute(
+        "CREATE TRIGGER comments_revision_ai AFTER INSERT ON comments BEGIN "
+        "UPDATE listings SET revision = revision + 1 WHERE id = new.listing_id; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER comments_revision_au AFTER UPDATE ON comments BEGIN "
+        "UPDATE listings SET revision = revision + 1 WHERE id = new.listing_id; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER comments_revision_ad AFTER DELETE ON comments BEGIN "
+        "UPDATE listings SET revision = revision + 1 WHERE id = old.listing_id; "
+        "END"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER comments_revision_ad")
+    op.execute("DROP TRIGGER comments_revision_au")
+    op.execute("DROP TRIGGER comments_revision_ai")
+    op.drop_column('listings', 'updated_at')
+    op.drop_column('listings', 'revision')
@@ -0,0 +1,212 @@
+"""Admission control: per-route-class concurrency limits and per-client rate limits.
+
+AdmissionMiddleware sorts each request into a route class (see
+route_class) and admits at most that class's concurrency limit at once;
+up to its queue size more wait in arrival order, and anything past that,
+or waiting longer than ADMISSION_QUEUE_TIMEOUT_SECONDS, is answered with
+a 503 and Retry-After at once. A slot is held until the response's last
+byte, so a streamed export counts for as long as it runs. Classes are
+independent: a burst of logins queues behind the auth limit while listing
+detail pages keep being served.
+
+Before that, when RATE_LIMIT_PER_SECOND is set, every client address
+draws from its own token bucket; an empty bucket is a 429 with the time
+until the next token.
+
+Everything runs on the event loop, so the counters need no locks.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from fastapi.responses import ORJSONResponse
+
+from . import config
+
+# monitoring must keep working while the API sheds load
+UNLIMITED_PATHS = frozenset(("/stats", "/metrics"))
+
+SEARCH_PATHS = frozenset(("/shanyraks/", "/shanyraks/map/clusters", "/shanyraks/bulk/export"))
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """The class whose limit a request counts against, or None for cheap reads."""
+    if method in ("GET", "HEAD"):
+        if path in SEARCH_PATHS or path.startswith("/analytics/"):
+            return "search"
+        return None
+    if method == "OPTIONS":
+        return None
+    # registering and logging in hash a password
+    if method == "POST" and path in ("/auth/users/", "/auth/users/login"):
+        return "auth"
+    return "writes"
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def acquire(self, timeout: float) -> bool:
+        """Take a slot, waiting in line for up to `timeout` seconds; False if the request should be shed."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done() or waiter.cancelled():
+                self.timed_out += 1
+                return False
+            # the slot was handed over just as the wait ran out
+        except asyncio.CancelledError:  # the client went away while waiting
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            waited = time.perf_counter() - started
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        # hand the slot straight to the longest waiter, so newcomers cannot overtake the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+
+
+class TokenBuckets:
+    """One token bucket per client, refilled lazily when the client is next seen."""
+
+    def __init__(self, rate: float, burst: int, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> (tokens, monotonic time of the last update), least recently seen first;
+        # a client evicted from a full table comes back with a full bucket
+        self._buckets: OrderedDict = OrderedDict()
+        self.limited = 0
+
+    def take(self, client: str) -> float:
+        """Spend one token; 0 if the request may go ahead, else the seconds until a token is available."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+            self.limited += 1
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {"clients": len(self._buckets), "rate_limited": self.limited}
+
+
+class AdmissionControl:
+    def __init__(self):
+        limits = {
+            "auth": (config.ADMISSION_AUTH_CONCURRENCY, config.ADMISSION_AUTH_QUEUE),
+            "search": (config.ADMISSION_SEARCH_CONCURRENCY, config.ADMISSION_SEARCH_QUEUE),
+            "writes": (config.ADMISSION_WRITES_CONCURRENCY, config.ADMISSION_WRITES_QUEUE),
+        }
+        self.limiters: Dict[str, ConcurrencyLimiter] = {
+            name: ConcurrencyLimiter(limit, queue) for name, (limit, queue) in limits.items() if limit > 0
+        }
+        self.buckets = None
+        if config.RATE_LIMIT_PER_SECOND > 0:
+            self.buckets = TokenBuckets(config.RATE_LIMIT_PER_SECOND, config.RATE_LIMIT_BURST,
+                                        config.RATE_LIMIT_MAX_CLIENTS)
+
+    def stats(self) -> dict:
+        stats = {}
+        for name, limiter in self.limiters.items():
+            stats.update({f"{name}_{key}": value for key, value in limiter.stats().items()})
+        if self.buckets is not None:
+            stats.update(self.buckets.stats())
+        return stats
+
+
+admission_control = AdmissionControl()
+
+
+def _client(scope) -> str:
+    # behind a proxy this is the real client only with uvicorn's --proxy-headers (see config)
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(scope, receive, send, status_code: int, detail: str, retry_after: float) -> None:
+    response = ORJSONResponse(
+        {"detail": detail}, status_code=status_code, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+    await response(scope, receive, send)
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware, so a slot is held until a streamed body is fully sent."""
+
+    def __init__(self, app, control: AdmissionControl = admission_control):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNLIMITED_PATHS:
+            return await self.app(scope, receive, send)
+
+        if self.control.buckets is not None:
+            wait = self.control.buckets.take(_client(scope))
+            if wait:
+                return await _reject(scope, receive, send, 429, "Too many requests", wait)
+
+        limiter = self.control.limiters.get(route_class(scope["method"], scope["path"]))
+        if limiter is None:
+            return await self.app(scope, receive, send)
+        if not await limiter.acquire(config.ADMISSION_QUEUE_TIMEOUT_SECONDS):
+            return await _reject(scope, receive, send, 503, "Server busy, try again",
+                                 config.ADMISSION_RETRY_AFTER_SECONDS)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,231 @@
+"""Price per m² statistics from an in-memory columnar snapshot of the listings.
+
+The snapshot keeps one NumPy array per column (price per m², type, rooms
+count, owner city) for every listing with an area. A request older than
+ANALYTICS_MAX_AGE_SECONDS refreshes it with the listings created since the
+last refresh, found by keyset on (created_at, id); every
+ANALYTICS_REBUILD_SECONDS it is rebuilt from scratch instead, which is what
+picks up edited and deleted listings and owners who moved. Statistics are
+computed for all groups at once from one sort and cached until the next
+refresh.
+"""
+import asyncio
+import copy
+import math
+import time
+from datetime import datetime
+from typing import Dict, List, Literal, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select, tuple_
+
+from . import config, models
+from .cache import TTLCache
+
+Dimension = Literal["type", "rooms_count", "city"]
+
+FETCH_BATCH_SIZE = 10000
+# listings without rooms_count are grouped under this code, as are negative
+# counts stored before the API rejected them: the group codes need rooms >= NO_ROOMS
+NO_ROOMS = -1
+
+
+class Vocabulary:
+    """Maps the values of a text column to small integer codes, so it groups like a number."""
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self._codes: Dict[Optional[str], int] = {}
+
+    def encode(self, values: Sequence[Optional[str]]) -> np.ndarray:
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        return codes
+
+
+class Snapshot:
+    def __init__(self):
+        self.types = Vocabulary()
+        self.cities = Vocabulary()
+        self.columns = {
+            "price_per_m2": np.empty(0, dtype=np.float64),
+            "type": np.empty(0, dtype=np.int32),
+            "rooms_count": np.empty(0, dtype=np.int32),
+            "city": np.empty(0, dtype=np.int32),
+        }
+        # (created_at, id) of the newest listing read so far
+        self.watermark: Optional[Tuple[datetime, int]] = None
+        self.built_at = time.monotonic()
+        self.refreshed_at = -math.inf
+        self.refreshed_at_utc: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self.columns["price_per_m2"])
+
+    def encode(self, rows) -> Dict[str, np.ndarray]:
+        """Column arrays for a batch of snapshot_query rows."""
+        _, _, types, rooms, cities, prices, areas = zip(*rows)
+        return {
+            "price_per_m2": np.asarray(prices, dtype=np.float64) / np.asarray(areas, dtype=np.float64),
+            "type": self.types.encode(types),
+            "rooms_count": np.asarray([NO_ROOMS if r is None or r < 0 else r for r in rooms], dtype=np.int32),
+            "city": self.cities.encode(cities),
+        }
+
+    def extended(self, chunks: List[Dict[str, np.ndarray]], watermark: Optional[Tuple[datetime, int]]) -> "Snapshot":
+        """A new snapshot with the encoded chunks added; this one is left as is for requests still reading it."""
+        snapshot = copy.copy(self)
+        if chunks:
+            columns = {name: np.concatenate([values, *(chunk[name] for chunk in chunks)])
+                       for name, values in self.columns.items()}
+            # rows are kept in price per m² order, so statistics only need a sort by group;
+            # the stable sort is close to linear on a sorted snapshot plus a short new tail
+            order = np.argsort(columns["price_per_m2"], kind="stable")
+            snapshot.columns = {name: values[order] for name, values in columns.items()}
+        snapshot.watermark = watermark
+        return snapshot
+
+    def group_codes(self, dimension: Dimension) -> Tuple[np.ndarray, int]:
+        """The dimension's codes shifted to start at 0, and how many there can be."""
+        if dimension == "type":
+            return self.columns["type"], len(self.types.values)
+        if dimension == "city":
+            return self.columns["city"], len(self.cities.values)
+        rooms = self.columns["rooms_count"]
+        return rooms - NO_ROOMS, int(rooms.max()) - NO_ROOMS + 1
+
+    def decode(self, dimension: Dimension, code: int):
+        if dimension == "type":
+            return self.types.values[code]
+        if dimension == "city":
+            return self.cities.values[code]
+        return None if code == NO_ROOMS else int(code)
+
+
+def snapshot_query(watermark: Optional[Tuple[datetime, int]]):
+    query = (
+        select(
+            models.Listing.created_at, models.Listing.id, models.Listing.type, models.Listing.rooms_count,
+            models.User.city, models.Listing.price, models.Listing.area,
+        )
+        .join(models.User, models.User.id == models.Listing.user_id)
+        .where(models.Listing.area > 0)
+        .order_by(models.Listing.created_at, models.Listing.id)
+    )
+    if watermark is not None:
+        query = query.where(tuple_(models.Listing.created_at, models.Listing.id) > tuple_(*watermark))
+    return query
+
+
+def price_stats(snapshot: Snapshot, group_by: Sequence[Dimension], percentiles: Sequence[float]) -> List[dict]:
+    """Count, mean and percentiles of price per m² for every group of group_by values."""
+    values = snapshot.columns["price_per_m2"]
+    if len(values) == 0:
+        return []
+
+    # one group id per row from the dimensions' codes; a small id sorts by radix
+    group_ids = np.zeros(len(values), dtype=np.int64)
+    groups_possible = 1
+    for dimension in group_by:
+        codes, size = snapshot.group_codes(dimension)
+        group_ids = group_ids * size + codes
+        groups_possible *= size
+    if groups_possible <= np.iinfo(np.uint16).max:
+        group_ids = group_ids.astype(np.uint16)
+
+    # rows are already in value order, so a stable sort by group leaves each group sorted
+    order = np.argsort(group_ids, kind="stable")
+    values = values[order]
+    group_ids = group_ids[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(group_ids)) + 1))
+    counts = np.diff(np.append(starts, len(values)))
+    firsts = order[starts]
+
+    # linear interpolation between closest ranks (numpy.percentile's default), every group and percentile at once
+    positions = starts[:, None] + (counts[:, None] - 1) * (np.asarray(percentiles, dtype=np.float64) / 100)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, (starts + counts - 1)[:, None])
+    quantiles = values[lower] + (values[upper] - values[lower]) * (positions - lower)
+    means = np.add.reduceat(values, starts) / counts
+
+    groups = []
+    for i in range(len(starts)):
+        group = {dimension: snapshot.decode(dimension, snapshot.columns[dimension][firsts[i]]) for dimension in group_by}
+        group["count"] = int(counts[i])
+        group["mean"] = round(float(means[i]), 1)
+        group["percentiles"] = {f"p{q:g}": round(float(v), 1) for q, v in zip(percentiles, quantiles[i])}
+        groups.append(group)
+    # codes follow first appearance; present groups by value, missing values last
+    groups.sort(key=lambda group: tuple((group[dimension] is None, group[dimension]) for dimension in group_by))
+    return groups
+
+
+class PriceAnalytics:
+    def __init__(self):
+        self.snapshot = Snapshot()
+        self.refreshes = 0
+        self.rebuilds = 0
+        # computed statistics, valid until the snapshot changes
+        self.results = TTLCache(maxsize=256, ttl=config.ANALYTICS_MAX_AGE_SECONDS)
+        self._lock = asyncio.Lock()
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.snapshot.refreshed_at >= config.ANALYTICS_MAX_AGE_SECONDS
+
+    async def refresh(self, db) -> None:
+        async with self._lock:
+            if not self.is_stale():  # another request refreshed it while this one waited
+                return
+            snapshot = self.snapshot
+            if time.monotonic() - snapshot.built_at >= config.ANALYTICS_REBUILD_SECONDS:
+                snapshot = Snapshot()
+                self.rebuilds += 1
+
+            # batches are encoded as they arrive; the vocabularies only ever
+            # grow, so sharing them with the snapshot being served is safe
+            chunks, watermark = [], snapshot.watermark
+            result = await db.stream(snapshot_query(watermark).execution_options(yield_per=FETCH_BATCH_SIZE))
+            async for rows in result.partitions():
+                chunks.append(snapshot.encode(rows))
+                watermark = (rows[-1].created_at, rows[-1].id)
+            # sorting millions of rows would stall every other request on the event loop
+            snapshot = await asyncio.to_thread(snapshot.extended, chunks, watermark)
+            snapshot.refreshed_at = time.monotonic()
+            snapshot.refreshed_at_utc = datetime.utcnow()
+
+            self.snapshot = snapshot
+            self.refreshes += 1
+            self.results.clear()
+
+    async def prices(self, db, group_by: Sequence[Dimension], percentiles: Sequence[float]) -> dict:
+        if self.is_stale():
+            await self.refresh(db)
+        key = (tuple(group_by), tuple(percentiles))
+        stats = self.results.get(key)
+        if stats is None:
+            snapshot = self.snapshot
+            stats = {
+                "listings": len(snapshot),
+                "refreshed_at": snapshot.refreshed_at_utc,
+                "groups": await asyncio.to_thread(price_stats, snapshot, group_by, percentiles),
+            }
+            if snapshot is self.snapshot:  # not replaced while these were computed
+                self.results.set(key, stats)
+        return stats
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self.snapshot),
+            "age_seconds": round(time.monotonic() - self.snapshot.refreshed_at, 3) if self.refreshes else None,
+            "refreshes": self.refreshes,
+            "rebuilds": self.rebuilds,
+            **{f"results_{key}": value for key, value in self.results.stats().items()},
+        }
+
+
+price_analytics = PriceAnalytics()
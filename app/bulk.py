@@ -0,0 +1,383 @@
+"""Bulk listing import for agency feeds, and streaming export for dumps.
+
+Rows arrive as NDJSON (one object per line) or CSV (header row first) and
+are validated with schemas.ListingImport. Valid rows are upserted on
+(user_id, external_id) in batched executemany transactions, so a feed can
+be re-imported safely.
+
+Exports walk a server-side cursor in (created_at|updated_at, id) order and
+encode rows as they arrive, so memory stays flat however many rows match.
+
+    python -m app.bulk import feed.ndjson --owner agency@example.kz
+    python -m app.bulk export dump.csv.gz --changed-since 2026-10-01T00:00:00
+"""
+import argparse
+import codecs
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, List, Literal, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import config, models, schemas
+from .database import AsyncSessionLocal, engine
+
+FeedFormat = Literal["ndjson", "csv"]
+ChangedField = Literal["created_at", "updated_at"]
+
+IMPORT_FIELDS = list(schemas.ListingImport.model_fields)
+
+EXPORT_COLUMNS = [
+    models.Listing.id,
+    models.Listing.user_id,
+    models.Listing.external_id,
+    models.Listing.type,
+    models.Listing.price,
+    models.Listing.address,
+    models.Listing.area,
+    models.Listing.rooms_count,
+    models.Listing.description,
+    models.Listing.latitude,
+    models.Listing.longitude,
+    models.Listing.created_at,
+    models.Listing.updated_at,
+]
+# the API's dumps leave out the import keys, which are the agencies' own
+PUBLIC_EXPORT_COLUMNS = [column for column in EXPORT_COLUMNS if column.key != "external_id"]
+
+
+def upsert_statement():
+    stmt = sqlite_insert(models.Listing)
+    fields = [field for field in IMPORT_FIELDS if field != "external_id"]
+    updates = {field: stmt.excluded[field] for field in fields}
+    updates["updated_at"] = stmt.excluded.updated_at
+    updates["revision"] = models.Listing.revision + 1
+    # a re-imported row that matches the stored one keeps its revision (ETag) and
+    # updated_at, so incremental exports don't send it again
+    changed = or_(*(getattr(models.Listing, field).is_distinct_from(stmt.excluded[field]) for field in fields))
+    # rows come back only for those inserted or updated, not those left alone
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "external_id"], set_=updates, where=changed
+    ).returning(models.Listing.external_id)
+
+
+class RowParser:
+    """Turns feed lines into raw row dicts, one line at a time."""
+
+    def __init__(self, format: FeedFormat):
+        self.format = format
+        self.line_no = 0
+        self.header = None
+        self._pending = []
+        self._start = 0
+
+    def feed(self, line: str):
+        """Returns (line_no, raw_row, error), or None if the line completes no row."""
+        self.line_no += 1
+        if self.format == "ndjson":
+            if not line.strip():
+                return None
+            try:
+                raw = json.loads(line)
+            except ValueError as exc:
+                return self.line_no, None, f"invalid JSON: {exc}"
+            if not isinstance(raw, dict):
+                return self.line_no, None, "expected a JSON object"
+            return self.line_no, raw, None
+
+        # a CSV record may span lines inside quotes; it is complete once its quotes balance
+        if not self._pending:
+            self._start = self.line_no
+        self._pending.append(line)
+        record = "".join(self._pending)
+        if record.count('"') % 2:
+            return None
+        self._pending = []
+        if not record.strip():
+            return None
+
+        values = next(csv.reader([record]))
+        if self.header is None:
+            self.header = [name.strip() for name in values]
+            return None
+        if len(values) != len(self.header):
+            return self._start, None, f"expected {len(self.header)} fields, got {len(values)}"
+        return self._start, {name: value or None for name, value in zip(self.header, values)}, None
+
+    def finish(self):
+        if self._pending:
+            self._pending = []
+            return self._start, None, "unterminated quoted field"
+        return None
+
+
+class Importer:
+    """Validates parsed rows and groups them into batches ready to upsert."""
+
+    def __init__(self, owner_id: int, format: FeedFormat, batch_size: int = config.IMPORT_BATCH_SIZE):
+        self.owner_id = owner_id
+        self.batch_size = batch_size
+        self.parser = RowParser(format)
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors = []
+        self._batch = {}
+
+    def feed(self, line: str) -> Optional[List[dict]]:
+        parsed = self.parser.feed(line)
+        if parsed is not None:
+            self._add(*parsed)
+        if len(self._batch) >= self.batch_size:
+            return self._take()
+        return None
+
+    def finish(self) -> Optional[List[dict]]:
+        parsed = self.parser.finish()
+        if parsed is not None:
+            self._add(*parsed)
+        return self._take() if self._batch else None
+
+    def existing_query(self, batch: List[dict]):
+        return select(models.Listing.external_id).where(
+            models.Listing.user_id == self.owner_id,
+            models.Listing.external_id.in_([row["external_id"] for row in batch]),
+        )
+
+    def record_written(self, batch: List[dict], existing, written) -> None:
+        """Tally a batch from the keys that existed before it and those the upsert returned."""
+        existing, written = set(existing), set(written)
+        self.inserted += len(written - existing)
+        self.updated += len(written & existing)
+        self.unchanged += len(existing - written)
+
+    def report(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+    def _add(self, line_no: int, raw: Optional[dict], error: Optional[str]) -> None:
+        if raw is not None:
+            try:
+                row = schemas.ListingImport.model_validate(raw)
+            except ValidationError as exc:
+                error = "; ".join(
+                    f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in exc.errors()
+                )
+            else:
+                # a repeated external_id within one batch keeps its last version
+                self._batch[row.external_id] = row.model_dump()
+                return
+        self.failed += 1
+        if len(self.errors) < config.IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": error})
+
+    def _take(self) -> List[dict]:
+        now = datetime.utcnow()
+        batch = [
+            dict(values, user_id=self.owner_id, created_at=now, updated_at=now)
+            for values in self._batch.values()
+        ]
+        self._batch = {}
+        return batch
+
+
+async def decode_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a streamed request body into lines without buffering the whole body."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def import_stream(db, owner_id: int, format: FeedFormat, lines: AsyncIterator[str], batch_size: int) -> dict:
+    importer = Importer(owner_id, format, batch_size)
+
+    async def write(batch):
+        existing = (await db.scalars(importer.existing_query(batch))).all()
+        written = (await db.scalars(upsert_statement(), batch)).all()
+        await db.commit()
+        importer.record_written(batch, existing, written)
+
+    async for line in lines:
+        batch = importer.feed(line)
+        if batch:
+            await write(batch)
+    batch = importer.finish()
+    if batch:
+        await write(batch)
+
+    return importer.report()
+
+
+def import_file(path: str, owner_username: str, format: FeedFormat, batch_size: int) -> dict:
+    with engine.connect() as conn:
+        owner_id = conn.scalar(select(models.User.id).where(models.User.username == owner_username))
+    if owner_id is None:
+        raise SystemExit(f"no user {owner_username!r}")
+
+    importer = Importer(owner_id, format, batch_size)
+
+    def write(batch):
+        with engine.begin() as conn:
+            existing = conn.scalars(importer.existing_query(batch)).all()
+            written = conn.scalars(upsert_statement(), batch).all()
+        importer.record_written(batch, existing, written)
+
+    with open(path, encoding="utf-8-sig", newline="") as feed:
+        for line in feed:
+            batch = importer.feed(line)
+            if batch:
+                write(batch)
+    batch = importer.finish()
+    if batch:
+        write(batch)
+    return importer.report()
+
+
+def export_query(
+    query,
+    changed_since: Optional[datetime] = None,
+    changed_field: ChangedField = "updated_at",
+    columns: List = EXPORT_COLUMNS,
+):
+    """Narrow a filtered listing query to the export columns and order.
+
+    Rows come out in (changed_field, id) order, so an incremental sync can
+    store the last timestamp it saw and pass it back as changed_since.
+    """
+    column = getattr(models.Listing, changed_field)
+    query = query.with_only_columns(*columns)
+    if changed_since is not None:
+        # timestamps are stored as naive UTC
+        if changed_since.tzinfo is not None:
+            changed_since = changed_since.astimezone(timezone.utc).replace(tzinfo=None)
+        query = query.where(column > changed_since)
+    return query.order_by(column, models.Listing.id)
+
+
+class RowEncoder:
+    """Encodes export rows to NDJSON or CSV bytes, gzipped on request."""
+
+    def __init__(self, format: FeedFormat, fields: List[str], compress: bool = False):
+        self.format = format
+        self.fields = fields
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(wbits=31) if compress else None
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        if format == "csv":
+            self._writer.writerow(fields)
+
+    def encode(self, rows: Iterable) -> bytes:
+        for row in rows:
+            values = [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            if self.format == "csv":
+                self._writer.writerow(values)
+            else:
+                self._buffer.write(json.dumps(dict(zip(self.fields, values)), ensure_ascii=False))
+                self._buffer.write("\n")
+        return self._take()
+
+    def finish(self) -> bytes:
+        data = self._take()
+        if self._compressor is not None:
+            data += self._compressor.flush()
+        return data
+
+    def _take(self) -> bytes:
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        return data
+
+
+async def export_stream(query, format: FeedFormat, compress: bool, sessions=AsyncSessionLocal) -> AsyncIterator[bytes]:
+    # the request's session is closed before the body is sent, so the
+    # stream opens its own and encodes one yield_per partition at a time
+    encoder = RowEncoder(format, list(query.selected_columns.keys()), compress)
+    async with sessions() as db:
+        result = await db.stream(query.execution_options(yield_per=config.EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            chunk = encoder.encode(rows)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+
+def export_file(path: str, query, format: FeedFormat, compress: bool) -> int:
+    encoder = RowEncoder(format, list(query.selected_columns.keys()), compress)
+    exported = 0
+    with engine.connect() as conn, open(path, "wb") as out:
+        result = conn.execution_options(yield_per=config.EXPORT_BATCH_SIZE).execute(query)
+        for rows in result.partitions():
+            exported += len(rows)
+            out.write(encoder.encode(rows))
+        out.write(encoder.finish())
+    return exported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.bulk")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_cmd = commands.add_parser("import", help="upsert listings from an NDJSON or CSV feed")
+    import_cmd.add_argument("path")
+    import_cmd.add_argument("--owner", required=True, help="username (email) the listings belong to")
+    import_cmd.add_argument("--format", choices=["ndjson", "csv"], help="defaults to the file extension")
+    import_cmd.add_argument("--batch-size", type=int, default=config.IMPORT_BATCH_SIZE)
+
+    export_cmd = commands.add_parser("export", help="stream listings to an NDJSON or CSV file")
+    export_cmd.add_argument("path", help="a .gz suffix gzips the output")
+    export_cmd.add_argument("--format", choices=["ndjson", "csv"], help="defaults to the file extension")
+    export_cmd.add_argument("--type")
+    export_cmd.add_argument("--rooms-count", type=int)
+    export_cmd.add_argument("--price-from", type=int)
+    export_cmd.add_argument("--price-until", type=int)
+    export_cmd.add_argument("--changed-since", type=datetime.fromisoformat, help="ISO timestamp, exclusive")
+    export_cmd.add_argument("--changed-field", choices=["created_at", "updated_at"], default="updated_at")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+        report = import_file(args.path, args.owner, format, args.batch_size)
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        if report["failed"]:
+            sys.exit(1)
+
+    elif args.command == "export":
+        from .routers.listings import filter_listings
+
+        name = args.path.lower().removesuffix(".gz")
+        format = args.format or ("csv" if name.endswith(".csv") else "ndjson")
+        query = filter_listings(
+            select(models.Listing), args.type, args.rooms_count, args.price_from, args.price_until
+        )
+        query = export_query(query, args.changed_since, args.changed_field)
+        exported = export_file(args.path, query, format, args.path.lower().endswith(".gz"))
+        print(json.dumps({"exported": exported}))
+
+
+if __name__ == "__main__":
+    main()
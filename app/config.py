@@ -0,0 +1,89 @@
+import os
+
+
+def _bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+# primary database, and an optional read replica for read-heavy routes (unset = read the primary);
+# both must be SQLite URLs; the API runs them on aiosqlite
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or None
+# after a write, that client reads from the primary for this long so it sees its own changes
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+# SQLite connection pragmas, applied to every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB, so 64 MiB
+SQLITE_FOREIGN_KEYS = _bool("SQLITE_FOREIGN_KEYS", True)
+
+# WAL lets every pooled reader run alongside the single writer SQLite allows;
+# writers queue on busy_timeout rather than on the pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# seconds before a pooled connection is replaced; -1 keeps connections forever
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+
+# map clustering: grid cells per web-map tile width at the requested zoom
+MAP_CLUSTER_CELLS_PER_TILE = int(os.getenv("MAP_CLUSTER_CELLS_PER_TILE", "8"))
+
+# resolved users cached by get_current_user, keyed by token subject
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+# password hashing: bcrypt cost and the dedicated pool that runs it
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+# bulk import: rows per executemany transaction, and how many row errors to report back
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "1000"))
+
+# bulk export: rows fetched per server-side cursor batch
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# metrics: statements at least this slow are logged with their query plan
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.1"))
+PLAN_CACHE_TTL_SECONDS = float(os.getenv("PLAN_CACHE_TTL_SECONDS", "3600"))
+# what a route exceeding its @query_budget does: "off", "log" or "raise"
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "log")
+
+# price analytics: how stale a served statistic may be, and how often the
+# snapshot is rebuilt from scratch rather than extended with new listings
+ANALYTICS_MAX_AGE_SECONDS = float(os.getenv("ANALYTICS_MAX_AGE_SECONDS", "300"))
+ANALYTICS_REBUILD_SECONDS = float(os.getenv("ANALYTICS_REBUILD_SECONDS", "3600"))
+
+# authentication: "database" resolves the caller's user row on every request
+# (through the user cache), "stateless" trusts the token's user id and version
+AUTH_MODE = os.getenv("AUTH_MODE", "database")
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# how often each process reloads revocations made by the others
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "5"))
+
+# admission control: concurrent requests per route class ("auth" = register and
+# login, "search" = listing scans, exports and analytics, "writes" = every other
+# non-GET), and how many more may wait for a slot; 0 leaves a class unlimited.
+# A request that finds the queue full, or waits ADMISSION_QUEUE_TIMEOUT_SECONDS,
+# gets a 503 with Retry-After
+ADMISSION_AUTH_CONCURRENCY = int(os.getenv("ADMISSION_AUTH_CONCURRENCY", "8"))
+ADMISSION_AUTH_QUEUE = int(os.getenv("ADMISSION_AUTH_QUEUE", "32"))
+ADMISSION_SEARCH_CONCURRENCY = int(os.getenv("ADMISSION_SEARCH_CONCURRENCY", "16"))
+ADMISSION_SEARCH_QUEUE = int(os.getenv("ADMISSION_SEARCH_QUEUE", "64"))
+ADMISSION_WRITES_CONCURRENCY = int(os.getenv("ADMISSION_WRITES_CONCURRENCY", "16"))
+ADMISSION_WRITES_QUEUE = int(os.getenv("ADMISSION_WRITES_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+# per-client rate limit: a token bucket refilled at RATE_LIMIT_PER_SECOND up to
+# RATE_LIMIT_BURST requests, keyed by client address; 0 (the default) turns it off.
+# The address is the socket peer: behind a reverse proxy, run uvicorn with
+# --proxy-headers and --forwarded-allow-ips set to the proxy, or every client
+# shares the proxy's bucket
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "40"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
@@ -0,0 +1,73 @@
+from typing import Literal, Optional, Union
+
+from sqlalchemy import DDL, Column, Integer, MetaData, Table, event, func, select
+
+from . import models
+from .cache import TTLCache
+
+CountStrategy = Literal["exact", "cached", "estimate", "none"]
+
+COUNT_CACHE_TTL_SECONDS = 300
+COUNT_ESTIMATE_CAP = 10000
+
+# a single counter bumped by any change that can move a listing in or out of
+# a filter; the triggers fire for every writer (API, bulk CLI, seed scripts),
+# so a cached count is keyed on it rather than cleared by this process's hooks
+GENERATION_DDL = (
+    "CREATE TABLE IF NOT EXISTS listings_generation (id INTEGER PRIMARY KEY CHECK (id = 1), "
+    "generation INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO listings_generation VALUES (1, 0)",
+    "CREATE TRIGGER IF NOT EXISTS listings_generation_ai AFTER INSERT ON listings BEGIN "
+    "UPDATE listings_generation SET generation = generation + 1; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS listings_generation_ad AFTER DELETE ON listings BEGIN "
+    "UPDATE listings_generation SET generation = generation + 1; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS listings_generation_au AFTER UPDATE OF "
+    "type, rooms_count, price, latitude, longitude, address, description ON listings "
+    "WHEN old.type IS NOT new.type OR old.rooms_count IS NOT new.rooms_count OR old.price IS NOT new.price "
+    "OR old.latitude IS NOT new.latitude OR old.longitude IS NOT new.longitude "
+    "OR old.address IS NOT new.address OR old.description IS NOT new.description BEGIN "
+    "UPDATE listings_generation SET generation = generation + 1; "
+    "END",
+)
+
+for _ddl in GENERATION_DDL:
+    event.listen(models.Listing.__table__, "after_create", DDL(_ddl))
+
+# not part of Base.metadata: it is created with the listings table's DDL above
+listings_generation = Table(
+    "listings_generation",
+    MetaData(),
+    Column("id", Integer),
+    Column("generation", Integer),
+)
+
+# entries for older generations are never read again and age out by TTL and LRU
+count_cache = TTLCache(maxsize=1024, ttl=COUNT_CACHE_TTL_SECONDS)
+
+
+async def count_listings(db, stmt, filters: dict, strategy: CountStrategy = "exact") -> Optional[Union[int, str]]:
+    if strategy == "none":
+        return None
+
+    if strategy == "estimate":
+        # stop counting once we know there are more rows than the cap
+        capped = stmt.with_only_columns(models.Listing.id).limit(COUNT_ESTIMATE_CAP + 1).subquery()
+        total = await db.scalar(select(func.count()).select_from(capped))
+        return f"{COUNT_ESTIMATE_CAP}+" if total > COUNT_ESTIMATE_CAP else total
+
+    filters = tuple(sorted(filters.items()))
+    if strategy == "cached":
+        generation = await db.scalar(select(listings_generation.c.generation))
+        total = count_cache.get((generation, filters))
+        if total is not None:
+            return total
+
+    # read the generation in the same statement, so the count is stored under
+    # the state it was taken from
+    generation = select(listings_generation.c.generation).scalar_subquery()
+    count_stmt = stmt.with_only_columns(generation, func.count(), maintain_column_froms=True)
+    generation, total = (await db.execute(count_stmt)).one()
+    count_cache.set((generation, filters), total)
+    return total
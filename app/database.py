@@ -1,13 +1,70 @@
-from sqlalchemy import create_engine
+import time
+
+from fastapi import Depends, Request, Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./database.db"
+from . import config
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False} 
-)
+# only SQLite is supported: search, geo, facets and counts depend on its FTS5,
+# R*Tree and triggers; the API talks to it through this asyncio driver
+ASYNC_DRIVER = "sqlite+aiosqlite"
+
+# set after a write; while it is valid, that client's reads go to the primary
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+
+
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS:d}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE:d}")
+    cursor.execute(f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE:d}")
+    # ON DELETE CASCADE is relied on instead of loading child rows before a delete
+    cursor.execute(f"PRAGMA foreign_keys={'ON' if config.SQLITE_FOREIGN_KEYS else 'OFF'}")
+    cursor.close()
+
+
+def _sqlite_url(url: str):
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        raise ValueError(f"unsupported database {url.drivername!r}: only SQLite is supported")
+    return url
+
+
+def create_sync_engine(url: str):
+    """The sync engine for schema creation, migrations and command line tools."""
+    sync_engine = create_engine(
+        _sqlite_url(url),
+        connect_args={"check_same_thread": False},
+        pool_recycle=config.DB_POOL_RECYCLE
+    )
+    event.listen(sync_engine, "connect", configure_sqlite_connection)
+    return sync_engine
+
+
+def create_api_engine(url: str):
+    """The async engine the API uses, so requests never hold a threadpool slot while waiting on the database."""
+    url = _sqlite_url(url)
+    async_engine = create_async_engine(
+        url.set(drivername=ASYNC_DRIVER),
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE
+    )
+    event.listen(async_engine.sync_engine, "connect", configure_sqlite_connection)
+    return async_engine
+
+
+engine = create_sync_engine(config.DATABASE_URL)
+async_engine = create_api_engine(config.DATABASE_URL)
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -15,11 +72,63 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# without a replica, reads share the primary's engine and sessions
+if config.READ_DATABASE_URL:
+    # the replica is only ever read through the API
+    async_read_engine = create_api_engine(config.READ_DATABASE_URL)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_read_engine = async_engine
+    AsyncReadSessionLocal = AsyncSessionLocal
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_write_db(response: Response, db=Depends(get_db)):
+    """The primary session, for routes that change data.
+
+    It is the same session get_current_user loads the caller with, and it
+    marks the client so its reads stay on the primary for
+    READ_YOUR_WRITES_SECONDS, past the replica's lag.
+    """
+    if AsyncReadSessionLocal is not AsyncSessionLocal:
+        response.set_cookie(
+            READ_PRIMARY_COOKIE,
+            str(int(time.time()) + config.READ_YOUR_WRITES_SECONDS),
+            max_age=config.READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="lax"
+        )
+    return db
+
+
+def read_sessionmaker(request: Request):
+    """The replica's sessionmaker, or the primary's for a client that wrote recently."""
+    if AsyncReadSessionLocal is AsyncSessionLocal:
+        return AsyncSessionLocal
     try:
+        if int(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time():
+            return AsyncSessionLocal
+    except ValueError:
+        pass
+    return AsyncReadSessionLocal
+
+
+async def get_read_db(sessions=Depends(read_sessionmaker), primary=Depends(get_db)):
+    # reads on the primary share the request's session with get_current_user
+    if sessions is AsyncSessionLocal:
+        yield primary
+        return
+    async with sessions() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
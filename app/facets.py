@@ -0,0 +1,152 @@
+from collections import defaultdict
+from typing import Callable, Dict, List, Literal, Optional, Sequence, Tuple
+
+from sqlalchemy import DDL, Column, Integer, MetaData, Table, Text, case, event, func, select
+
+from . import models
+
+Facet = Literal["type", "rooms_count", "price"]
+
+# tenge; bucket k holds prices in [PRICE_EDGES[k - 1], PRICE_EDGES[k]), the
+# first and last buckets are open-ended. Monthly rents sit in the lower half,
+# sale prices in the upper.
+PRICE_EDGES = (
+    50_000, 100_000, 150_000, 200_000, 300_000, 500_000, 1_000_000,
+    5_000_000, 10_000_000, 20_000_000, 30_000_000, 50_000_000, 100_000_000,
+)
+LAST_BUCKET = len(PRICE_EDGES)
+# listings without rooms_count are counted under this key
+NO_ROOMS = -1
+
+
+def price_bucket_sql(price: str) -> str:
+    whens = " ".join(f"WHEN {price} < {edge} THEN {i}" for i, edge in enumerate(PRICE_EDGES))
+    return f"CASE {whens} ELSE {LAST_BUCKET} END"
+
+
+def _facet_key_sql(row: str) -> str:
+    return f"{row}.type, coalesce({row}.rooms_count, {NO_ROOMS}), {price_bucket_sql(row + '.price')}"
+
+
+# listing counts per (type, rooms_count, price bucket); the triggers keep it in
+# step with every insert, update and delete, including bulk upserts and cascades
+FACETS_DDL = (
+    "CREATE TABLE IF NOT EXISTS listing_facets ("
+    "type TEXT NOT NULL, rooms_key INTEGER NOT NULL, price_bucket INTEGER NOT NULL, count INTEGER NOT NULL, "
+    "PRIMARY KEY (type, rooms_key, price_bucket)) WITHOUT ROWID",
+    "CREATE TRIGGER IF NOT EXISTS listing_facets_ai AFTER INSERT ON listings BEGIN "
+    f"INSERT INTO listing_facets VALUES ({_facet_key_sql('new')}, 1) "
+    "ON CONFLICT (type, rooms_key, price_bucket) DO UPDATE SET count = count + 1; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS listing_facets_ad AFTER DELETE ON listings BEGIN "
+    "UPDATE listing_facets SET count = count - 1 "
+    f"WHERE (type, rooms_key, price_bucket) = ({_facet_key_sql('old')}); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS listing_facets_au AFTER UPDATE OF type, rooms_count, price ON listings "
+    "WHEN old.type IS NOT new.type OR old.rooms_count IS NOT new.rooms_count OR old.price IS NOT new.price BEGIN "
+    "UPDATE listing_facets SET count = count - 1 "
+    f"WHERE (type, rooms_key, price_bucket) = ({_facet_key_sql('old')}); "
+    f"INSERT INTO listing_facets VALUES ({_facet_key_sql('new')}, 1) "
+    "ON CONFLICT (type, rooms_key, price_bucket) DO UPDATE SET count = count + 1; "
+    "END",
+)
+
+for _ddl in FACETS_DDL:
+    event.listen(models.Listing.__table__, "after_create", DDL(_ddl))
+
+REBUILD_FACETS_SQL = (
+    "DELETE FROM listing_facets",
+    f"INSERT INTO listing_facets SELECT {_facet_key_sql('listings')}, count(*) FROM listings GROUP BY 1, 2, 3",
+)
+
+# not part of Base.metadata: it is created with the listings table's DDL above
+listing_facets = Table(
+    "listing_facets",
+    MetaData(),
+    Column("type", Text),
+    Column("rooms_key", Integer),
+    Column("price_bucket", Integer),
+    Column("count", Integer),
+)
+
+price_bucket = case(
+    *((models.Listing.price < edge, i) for i, edge in enumerate(PRICE_EDGES)), else_=LAST_BUCKET
+)
+
+
+def bucket_range(price_from: Optional[int], price_until: Optional[int]) -> Optional[Tuple[int, int]]:
+    """The price buckets a price filter covers exactly, or None if a bound falls inside a bucket."""
+    try:
+        first = 0 if price_from is None else PRICE_EDGES.index(price_from) + 1
+        last = LAST_BUCKET if price_until is None else PRICE_EDGES.index(price_until + 1)
+    except ValueError:
+        return None
+    return first, last
+
+
+async def facet_counts(
+    db,
+    facets: Sequence[Facet],
+    type: Optional[str],
+    rooms_count: Optional[int],
+    price_from: Optional[int],
+    price_until: Optional[int],
+    scope: Optional[Callable] = None,
+) -> Dict[str, List[dict]]:
+    """Listing counts per value of each requested facet, each under every filter but its own.
+
+    scope applies the filters the aggregates know nothing about (text search,
+    geography) to a Listing select. Without it, and with price bounds on
+    bucket edges, the counts come from listing_facets; otherwise from one
+    live GROUP BY, where the price facet then only covers the requested range.
+    """
+    buckets = bucket_range(price_from, price_until)
+    if scope is None and buckets is not None:
+        query = select(listing_facets.c.type, listing_facets.c.rooms_key, listing_facets.c.price_bucket,
+                       listing_facets.c.count).where(listing_facets.c.count > 0)
+    else:
+        rooms_key = func.coalesce(models.Listing.rooms_count, NO_ROOMS)
+        query = select(models.Listing.type, rooms_key, price_bucket, func.count()).group_by(
+            models.Listing.type, rooms_key, price_bucket
+        )
+        if scope is not None:
+            query = scope(query)
+        if buckets is None:
+            if price_from is not None:
+                query = query.where(models.Listing.price >= price_from)
+            if price_until is not None:
+                query = query.where(models.Listing.price <= price_until)
+            buckets = (0, LAST_BUCKET)
+    rows = (await db.execute(query)).all()
+    return tally(rows, facets, type, rooms_count, buckets)
+
+
+def tally(rows, facets: Sequence[Facet], type, rooms_count, buckets: Tuple[int, int]) -> Dict[str, List[dict]]:
+    first, last = buckets
+    counts = {facet: defaultdict(int) for facet in facets}
+    for row_type, row_rooms, row_bucket, count in rows:
+        matches = {
+            "type": type is None or row_type == type,
+            "rooms_count": rooms_count is None or row_rooms == rooms_count,
+            "price": first <= row_bucket <= last,
+        }
+        keys = {"type": row_type, "rooms_count": row_rooms, "price": row_bucket}
+        for facet in facets:
+            # ignoring the facet's own filter shows what else the client could pick
+            if all(ok for name, ok in matches.items() if name != facet):
+                counts[facet][keys[facet]] += count
+
+    result = {}
+    for facet, values in counts.items():
+        if facet == "type":
+            result[facet] = [{"value": value, "count": count}
+                             for value, count in sorted(values.items(), key=lambda item: (-item[1], item[0]))]
+        elif facet == "rooms_count":
+            result[facet] = [{"value": None if value == NO_ROOMS else value, "count": count}
+                             for value, count in sorted(values.items(), key=lambda item: (item[0] == NO_ROOMS, item[0]))]
+        else:
+            result[facet] = [{"price_from": PRICE_EDGES[bucket - 1] if bucket > 0 else None,
+                              "price_until": PRICE_EDGES[bucket] - 1 if bucket < LAST_BUCKET else None,
+                              "count": count}
+                             for bucket, count in sorted(values.items())]
+    return result
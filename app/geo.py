@@ -0,0 +1,101 @@
+import math
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import DDL, Column, Float, Integer, MetaData, Table, event
+
+from . import models
+
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LNG_AT_EQUATOR = 111.320
+
+# R*Tree over listing coordinates (points stored as zero-area boxes); the
+# triggers keep it in step with listings that have both coordinates set
+RTREE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS listings_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    "CREATE TRIGGER IF NOT EXISTS listings_rtree_ai AFTER INSERT ON listings "
+    "WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN "
+    "INSERT INTO listings_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS listings_rtree_ad AFTER DELETE ON listings BEGIN "
+    "DELETE FROM listings_rtree WHERE id = old.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS listings_rtree_au AFTER UPDATE OF latitude, longitude ON listings BEGIN "
+    "DELETE FROM listings_rtree WHERE id = old.id; "
+    "INSERT INTO listings_rtree SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude "
+    "WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL; "
+    "END",
+)
+
+for _ddl in RTREE_DDL:
+    event.listen(models.Listing.__table__, "after_create", DDL(_ddl))
+
+# not part of Base.metadata: create_all must not try to create it as a plain table
+listings_rtree = Table(
+    "listings_rtree",
+    MetaData(),
+    Column("id", Integer),
+    Column("min_lat", Float),
+    Column("max_lat", Float),
+    Column("min_lng", Float),
+    Column("max_lng", Float),
+)
+
+BBox = Tuple[float, float, float, float]
+
+
+def parse_bbox(bbox: str) -> BBox:
+    """Parse "west,south,east,north" in degrees."""
+    try:
+        west, south, east, north = (float(part) for part in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be west,south,east,north")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(status_code=400, detail="bbox is out of range")
+    return west, south, east, north
+
+
+def radius_bbox(lat: float, lng: float, radius_km: float) -> BBox:
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlng = radius_km / (KM_PER_DEGREE_LNG_AT_EQUATOR * max(math.cos(math.radians(lat)), 1e-6))
+    return max(lng - dlng, -180), max(lat - dlat, -90), min(lng + dlng, 180), min(lat + dlat, 90)
+
+
+def apply_bbox(query, bbox: BBox):
+    """Restrict a Listing select to points inside the box, using the R*Tree."""
+    west, south, east, north = bbox
+    return query.join(listings_rtree, listings_rtree.c.id == models.Listing.id).where(
+        listings_rtree.c.max_lat >= south,
+        listings_rtree.c.min_lat <= north,
+        listings_rtree.c.max_lng >= west,
+        listings_rtree.c.min_lng <= east,
+    )
+
+
+def apply_radius(query, lat: float, lng: float, radius_km: float):
+    """Restrict a Listing select to points within radius_km of (lat, lng).
+
+    The R*Tree narrows the search to the enclosing box; the exact cut uses an
+    equirectangular distance, which is plenty accurate at city scale and
+    needs no trigonometry inside SQLite.
+    """
+    query = apply_bbox(query, radius_bbox(lat, lng, radius_km))
+    dy = (models.Listing.latitude - lat) * KM_PER_DEGREE_LAT
+    dx = (models.Listing.longitude - lng) * (KM_PER_DEGREE_LNG_AT_EQUATOR * math.cos(math.radians(lat)))
+    return query.where(dx * dx + dy * dy <= radius_km * radius_km)
+
+
+def cluster_cell_size(zoom: int, cells_per_tile: int) -> float:
+    """Grid cell size in degrees for a web map zoom level."""
+    return 360.0 / (2 ** zoom) / cells_per_tile
+
+
+def geo_filter(query, bbox: Optional[str], lat: Optional[float], lng: Optional[float], radius_km: Optional[float]):
+    """Apply the bbox or radius search mode requested on GET /shanyraks/, if any."""
+    if lat is None and lng is None and radius_km is None:
+        return query if bbox is None else apply_bbox(query, parse_bbox(bbox))
+    if lat is None or lng is None or radius_km is None:
+        raise HTTPException(status_code=400, detail="lat, lng and radius_km must be given together")
+    if bbox is not None:
+        raise HTTPException(status_code=400, detail="Use either bbox or lat/lng/radius_km, not both")
+    return apply_radius(query, lat, lng, radius_km)
@@ -1,17 +1,72 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from .database import Base, engine
-from .routers import users, listings, comments
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from .admission import AdmissionMiddleware, admission_control
+from .analytics import price_analytics
+from . import config
+from .database import AsyncSessionLocal, Base, async_engine, async_read_engine, engine
+from .counting import count_cache
+from .metrics import CONTENT_TYPE, MetricsMiddleware, instrument_engine, query_budget, render
+from .routers import users, listings, comments, favorites, bulk, analytics
+from .security import hashing_pool, revocations, user_cache
 
 from . import models
 
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # follow revocations made by other processes for as long as this one serves
+    refresher = asyncio.create_task(revocations.run(AsyncSessionLocal, config.REVOCATION_REFRESH_SECONDS))
+    yield
+    refresher.cancel()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Shanyraq.kz MVP",
     version="1.0.0",
-    description="A marketplace for real estate in Kazakhstan (MVP)."
+    description="A marketplace for real estate in Kazakhstan (MVP).",
+    default_response_class=ORJSONResponse
 )
 
+# added first so it runs inside the metrics middleware, which then also counts shed requests
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+if async_read_engine is not async_engine:
+    instrument_engine(async_read_engine.sync_engine)
+
 app.include_router(users.router)
 app.include_router(listings.router)
 app.include_router(comments.router)
+app.include_router(favorites.router)
+app.include_router(bulk.router)
+app.include_router(analytics.router)
+
+
+def collect_stats() -> dict:
+    return {
+        "user_cache": user_cache.stats(),
+        "count_cache": count_cache.stats(),
+        "password_hashing": hashing_pool.stats(),
+        "price_analytics": price_analytics.stats(),
+        "revocations": revocations.stats(),
+        "admission": admission_control.stats(),
+    }
+
+
+@app.get("/stats", include_in_schema=False)
+@query_budget(0)
+async def stats():
+    return collect_stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+@query_budget(0)
+async def metrics():
+    return PlainTextResponse(render(collect_stats()), media_type=CONTENT_TYPE)
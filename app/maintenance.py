@@ -0,0 +1,91 @@
+"""Offline maintenance commands.
+
+    python -m app.maintenance recount-comments
+    python -m app.maintenance rebuild-facets
+    python -m app.maintenance sync-replica [--interval SECONDS]
+"""
+import argparse
+import sqlite3
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from . import config
+from .database import engine
+from .facets import REBUILD_FACETS_SQL
+
+RECOUNT_COMMENTS_SQL = """
+UPDATE listings
+SET comments_count = (SELECT count(*) FROM comments WHERE comments.listing_id = listings.id),
+    revision = revision + 1
+WHERE comments_count != (SELECT count(*) FROM comments WHERE comments.listing_id = listings.id)
+"""
+
+
+def recount_comments() -> int:
+    """Recompute listings.comments_count in bulk; returns the number of rows repaired."""
+    with engine.begin() as conn:
+        return conn.execute(text(RECOUNT_COMMENTS_SQL)).rowcount
+
+
+def rebuild_facets() -> int:
+    """Recompute the listing_facets aggregates from scratch; returns the number of facet rows."""
+    with engine.begin() as conn:
+        for statement in REBUILD_FACETS_SQL:
+            conn.execute(text(statement))
+        return conn.scalar(text("SELECT count(*) FROM listing_facets"))
+
+
+def sync_replica() -> int:
+    """Copy the primary SQLite database over READ_DATABASE_URL's file; returns the pages copied.
+
+    Stands in for replication when both databases are local SQLite files.
+    The online backup API copies a consistent snapshot while the API keeps
+    writing, and replica readers see the old or the new copy, never a mix.
+    """
+    if not config.READ_DATABASE_URL:
+        raise SystemExit("READ_DATABASE_URL is not set")
+    primary, replica = make_url(config.DATABASE_URL), make_url(config.READ_DATABASE_URL)
+    if primary.get_backend_name() != "sqlite" or replica.get_backend_name() != "sqlite":
+        raise SystemExit("sync-replica only copies SQLite files; use the server's own replication otherwise")
+
+    pages = 0
+
+    def progress(status, remaining, total):
+        nonlocal pages
+        pages = total
+
+    source = sqlite3.connect(primary.database)
+    target = sqlite3.connect(replica.database)
+    try:
+        source.backup(target, progress=progress)
+    finally:
+        target.close()
+        source.close()
+    return pages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("recount-comments", help="repair denormalized listing comment counters")
+    commands.add_parser("rebuild-facets", help="recompute the search facet counts from the listings")
+    sync = commands.add_parser("sync-replica", help="copy the primary SQLite file to the read replica")
+    sync.add_argument("--interval", type=float, help="keep copying every INTERVAL seconds")
+    args = parser.parse_args(argv)
+
+    if args.command == "recount-comments":
+        print(f"repaired comments_count on {recount_comments()} listings")
+    elif args.command == "rebuild-facets":
+        print(f"rebuilt {rebuild_facets()} facet rows")
+    elif args.command == "sync-replica":
+        while True:
+            print(f"copied {sync_replica()} pages to the replica", flush=True)
+            if args.interval is None:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""Per-request latency and SQL instrumentation, rendered for Prometheus.
+
+MetricsMiddleware opens a RequestStats for every HTTP request in a context
+variable; cursor-execute hooks on the engines add each statement and its
+time to whichever request is running it. When the response is sent the
+totals go into per-route histograms. Statements slower than
+SLOW_QUERY_SECONDS are logged with their EXPLAIN QUERY PLAN; the plan is
+looked up once per distinct statement and reused for PLAN_CACHE_TTL_SECONDS.
+
+Endpoints declare how many statements a call may run with @query_budget(n)
+(dependencies such as get_current_user included). QUERY_BUDGET_MODE decides
+what crossing it does: "log" warns, "raise" fails the statement with
+QueryBudgetExceeded (benchmarks/query_budgets.py runs every route that
+way), "off" skips the check. count_queries() counts statements in a block
+of code outside any request.
+
+The hot path is a perf_counter call and a few additions per statement and
+one histogram update per request under a lock, so it is meant to stay on.
+"""
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import event
+
+from . import config
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21, 50, 100)
+INF_BUCKET = 'le="+Inf"'
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries: int):
+    """Declare the most SQL statements one call of this endpoint may run.
+
+    Goes under the route decorator:
+
+        @router.get("/{listing_id}")
+        @query_budget(2)
+        async def get_listing(...):
+    """
+    def decorate(endpoint):
+        endpoint.__query_budget__ = max_queries
+        return endpoint
+    return decorate
+
+
+class RequestStats:
+    __slots__ = ("scope", "parent", "queries", "db_seconds")
+
+    def __init__(self, scope, parent: Optional["RequestStats"] = None):
+        self.scope = scope
+        # an enclosing count_queries() block also sees this request's statements
+        self.parent = parent
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        # the router stores the matched route in the scope; label by its template
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+    @property
+    def budget(self) -> Optional[int]:
+        route = self.scope.get("route")
+        return getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+@contextmanager
+def count_queries() -> Iterator[RequestStats]:
+    """Count the statements run inside the block, including those of ASGI calls made from it in-process."""
+    stats = RequestStats({}, parent=_request_stats.get())
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # per-bucket counts (not cumulative), then sum and count
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labels, label_values, INF_BUCKET)} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {series[-1]}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            snapshot = dict(self._values)
+        for label_values, value in sorted(snapshot.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+REQUEST_LABELS = ("method", "route")
+
+http_requests = Counter("http_requests_total", "HTTP requests served.", REQUEST_LABELS + ("status",))
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time from request start to the last body byte.", REQUEST_LABELS
+)
+http_request_queries = Histogram(
+    "http_request_db_queries", "SQL statements executed per request.", REQUEST_LABELS, QUERY_COUNT_BUCKETS
+)
+http_request_db_time = Histogram(
+    "http_request_db_seconds", "Time spent executing SQL per request.", REQUEST_LABELS
+)
+db_query_duration = Histogram("db_query_duration_seconds", "Time per SQL statement, including background work.")
+db_slow_queries = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_SECONDS.", ("route",))
+
+REGISTRY = (http_requests, http_request_duration, http_request_queries, http_request_db_time,
+            db_query_duration, db_slow_queries)
+
+# statement -> plan text; plans of hot slow statements are not re-explained every time
+_plan_cache = TTLCache(maxsize=256, ttl=config.PLAN_CACHE_TTL_SECONDS)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed bodies are timed to their last byte."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(scope, parent=_request_stats.get())
+        token = _request_stats.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+            labels = (scope["method"], stats.route)
+            http_requests.inc(*labels, status)
+            http_request_duration.observe(elapsed, *labels)
+            http_request_queries.observe(stats.queries, *labels)
+            http_request_db_time.observe(stats.db_seconds, *labels)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is not None and config.QUERY_BUDGET_MODE != "off" and not conn.info.get("explaining"):
+        budget = stats.budget
+        # only the statement that crosses the budget reports, not every one after it
+        if budget is not None and stats.queries == budget:
+            message = f"{stats.scope['method']} {stats.route} exceeded its budget of {budget} queries with: {statement}"
+            if config.QUERY_BUDGET_MODE == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+    context.metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.metrics_started
+    if conn.info.get("explaining"):
+        return
+
+    db_query_duration.observe(elapsed)
+    stats = _request_stats.get()
+    while stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        stats = stats.parent
+
+    if elapsed >= config.SLOW_QUERY_SECONDS:
+        route = _current_route()
+        db_slow_queries.inc(route)
+        logger.warning(
+            "slow query (%.1f ms) on %s: %s\n%s",
+            elapsed * 1000, route, " ".join(statement.split()),
+            _query_plan(conn, statement, parameters, executemany),
+        )
+
+
+def _current_route() -> str:
+    stats = _request_stats.get()
+    return stats.route if stats is not None else "none"
+
+
+def _query_plan(conn, statement, parameters, executemany) -> str:
+    if executemany or not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+        return "    (no plan)"
+    plan = _plan_cache.get(statement)
+    if plan is None:
+        conn.info["explaining"] = True
+        try:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            plan = "\n".join(f"    {row[3]}" for row in rows)
+        except Exception as exc:  # the plan is diagnostics only; never fail the query over it
+            plan = f"    (plan unavailable: {exc})"
+        finally:
+            conn.info["explaining"] = False
+        _plan_cache.set(statement, plan)
+    return plan
+
+
+def instrument_engine(engine) -> None:
+    """Attach the statement hooks; for an AsyncEngine pass engine.sync_engine."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def render(stats: dict) -> str:
+    """The registry plus every /stats value, flattened to gauges named shanyraq_<section>_<key>."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for section, values in stats.items():
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = f"shanyraq_{section}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -1,6 +1,6 @@
-from sqlalchemy import Table, Column, Integer, ForeignKey
+from sqlalchemy import Table, Column, Integer, ForeignKey, Index, DDL, event
 from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import backref, relationship
 from datetime import datetime
 
 from .database import Base
@@ -16,10 +16,25 @@ class User(Base):
     phone = Column(String, nullable=True)
     name = Column(String, nullable=True)
     city = Column(String, nullable=True)
+    # carried in every token; bumping it revokes all of the user's tokens
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
-    listings = relationship("Listing", back_populates="owner", cascade="all, delete-orphan")
-    comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan")
-    favorites = relationship("Listing", secondary="favorites", backref="favorited_by", cascade="all, delete")
+    # relationships never lazy load: an unplanned access raises instead of
+    # becoming a query per row; load them with selectinload()/joinedload()
+    listings = relationship(
+        "Listing", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True, lazy="raise"
+    )
+    comments = relationship(
+        "Comment", back_populates="author", cascade="all, delete-orphan", passive_deletes=True, lazy="raise"
+    )
+    favorites = relationship(
+        "Listing",
+        secondary="favorites",
+        backref=backref("favorited_by", passive_deletes=True, lazy="raise"),
+        cascade="all, delete",
+        passive_deletes=True,
+        lazy="raise",
+    )
 
 
 class Listing(Base):
@@ -33,11 +48,38 @@ class Listing(Base):
     rooms_count = Column(Integer, nullable=True)
     description = Column(Text, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    # agency's own id for the listing; bulk imports upsert on (user_id, external_id)
+    external_id = Column(String, nullable=True)
 
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # bumped on every change to the listing or its comments; backs the ETags
+    revision = Column(Integer, nullable=False, default=1, server_default="1")
+    comments_count = Column(Integer, nullable=False, default=0, server_default="0")
 
-    owner = relationship("User", back_populates="listings")
-    comments = relationship("Comment", back_populates="listing", cascade="all, delete-orphan")
+    owner = relationship("User", back_populates="listings", lazy="raise")
+    comments = relationship(
+        "Comment", back_populates="listing", cascade="all, delete-orphan", passive_deletes=True, lazy="raise"
+    )
+
+    __table_args__ = (
+        # list_shanyraks: default sort and cursor seek
+        Index("ix_listings_created_at_id", "created_at", "id"),
+        # incremental exports: rows changed since the last sync, in change order
+        Index("ix_listings_updated_at_id", "updated_at", "id"),
+        # list_shanyraks filters: equality on type/rooms_count, range on price
+        Index("ix_listings_type_rooms_count_price", "type", "rooms_count", "price"),
+        # the same equality filters in page order, so a page is a seek rather than a sort of every match
+        Index("ix_listings_type_created_at_id", "type", "created_at", "id"),
+        Index("ix_listings_type_rooms_count_created_at_id", "type", "rooms_count", "created_at", "id"),
+        Index("ix_listings_rooms_count_created_at_id", "rooms_count", "created_at", "id"),
+        Index("ix_listings_rooms_count_price", "rooms_count", "price"),
+        Index("ix_listings_price", "price"),
+        # bulk import upserts; its leading user_id also serves owner lookups and the users FK cascade
+        Index("ix_listings_user_id_external_id", "user_id", "external_id", unique=True),
+    )
 
 
 class Comment(Base):
@@ -45,16 +87,62 @@ class Comment(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # the comment cursor is (created_at, id), so every comment needs one
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     listing_id = Column(Integer, ForeignKey("listings.id", ondelete="CASCADE"), nullable=False)
     author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
-    listing = relationship("Listing", back_populates="comments")
-    author = relationship("User", back_populates="comments")
+    listing = relationship("Listing", back_populates="comments", lazy="raise")
+    author = relationship("User", back_populates="comments", lazy="raise")
+
+    __table_args__ = (
+        # get_comments: thread order and cursor seek within a listing
+        Index("ix_comments_listing_id_created_at", "listing_id", "created_at", "id"),
+        Index("ix_comments_author_id", "author_id"),
+    )
+
+# comments_count and revision on listings are maintained by the database, so
+# they stay right for every write path, including ON DELETE CASCADE
+COMMENT_TRIGGERS_DDL = (
+    "CREATE TRIGGER IF NOT EXISTS comments_listing_ai AFTER INSERT ON comments BEGIN "
+    "UPDATE listings SET comments_count = comments_count + 1, revision = revision + 1 "
+    "WHERE id = new.listing_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS comments_listing_au AFTER UPDATE ON comments BEGIN "
+    "UPDATE listings SET revision = revision + 1 WHERE id = new.listing_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS comments_listing_ad AFTER DELETE ON comments BEGIN "
+    "UPDATE listings SET comments_count = comments_count - 1, revision = revision + 1 "
+    "WHERE id = old.listing_id; "
+    "END",
+)
+
+for _ddl in COMMENT_TRIGGERS_DDL:
+    event.listen(Comment.__table__, "after_create", DDL(_ddl))
 
 favorites_table = Table(
     "favorites",
     Base.metadata,
     Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
     Column("listing_id", Integer, ForeignKey("listings.id", ondelete="CASCADE"), primary_key=True),
-)
\ No newline at end of file
+    Index("ix_favorites_listing_id", "listing_id"),
+)
+
+class TokenRevocation(Base):
+    """A revoked token by its jti, or every token of user_id older than token_version."""
+    __tablename__ = "token_revocations"
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    token_version = Column(Integer, nullable=True)
+    # once the revoked tokens have expired on their own the row can go
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_token_revocations_expires_at", "expires_at"),
+        # a refresh token can be rotated out only once, even by concurrent requests
+        Index("ix_token_revocations_jti", "jti", unique=True),
+        # ids are never reused, so processes can follow the table by max(id)
+        {"sqlite_autoincrement": True},
+    )
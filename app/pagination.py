@@ -0,0 +1,29 @@
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_after(created_at_col, id_col, cursor: str, descending: bool = True):
+    """Filter for rows strictly after the cursor in (created_at, id) order."""
+    created_at, id = decode_cursor(cursor)
+    if descending:
+        return tuple_(created_at_col, id_col) < tuple_(created_at, id)
+    return tuple_(created_at_col, id_col) > tuple_(created_at, id)
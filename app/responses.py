@@ -0,0 +1,14 @@
+from typing import Optional
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+def model_response(model: BaseModel, headers: Optional[dict] = None) -> ORJSONResponse:
+    """Serialize a response model once and hand it straight to orjson.
+
+    Returning the model itself would make FastAPI dump it, re-validate the
+    dump against response_model and dump it again. Unset optional fields
+    (like is_favorite) are left out, the same as before the models existed.
+    """
+    return ORJSONResponse(model.model_dump(mode="json", by_alias=True, exclude_unset=True), headers=headers)
@@ -0,0 +1,88 @@
+"""In-memory copy of the token_revocations table.
+
+Every authenticated request checks its token here, without a query.
+Revocations made by this process apply at once; run() follows the table
+for the ones other processes make, with a delay of at most
+REVOCATION_REFRESH_SECONDS, and drops rows whose tokens have expired
+anyway.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+
+from sqlalchemy import delete, select
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+def _epoch(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RevocationList:
+    def __init__(self):
+        # jti -> when the token expires (epoch seconds)
+        self._tokens: Dict[str, float] = {}
+        # user id -> (lowest token version still valid, when the older tokens expire)
+        self._versions: Dict[int, Tuple[int, float]] = {}
+        self._last_id = 0
+        self.refreshes = 0
+
+    def is_revoked(self, claims: dict) -> bool:
+        return self.token_revoked(claims) or self.version_revoked(claims)
+
+    def token_revoked(self, claims: dict) -> bool:
+        """This very token was revoked, by logout or by refresh token rotation."""
+        return claims.get("jti") in self._tokens
+
+    def version_revoked(self, claims: dict) -> bool:
+        """All of the user's tokens up to this one's version were revoked."""
+        revoked = self._versions.get(claims.get("uid"))
+        return revoked is not None and claims.get("ver", 0) < revoked[0]
+
+    def add(self, revocation: models.TokenRevocation) -> None:
+        expires = _epoch(revocation.expires_at)
+        if revocation.jti is not None:
+            self._tokens[revocation.jti] = expires
+        if revocation.user_id is not None and revocation.token_version is not None:
+            current = self._versions.get(revocation.user_id)
+            if current is None or current[0] < revocation.token_version:
+                self._versions[revocation.user_id] = (revocation.token_version, expires)
+
+    async def refresh(self, db) -> None:
+        rows = await db.scalars(
+            select(models.TokenRevocation)
+            .where(models.TokenRevocation.id > self._last_id)
+            .order_by(models.TokenRevocation.id)
+        )
+        # only rows read here move the watermark: one added by this process can
+        # have a higher id than another process's row not yet read
+        for revocation in rows:
+            self.add(revocation)
+            self._last_id = revocation.id
+
+        now = time.time()
+        self._tokens = {jti: expires for jti, expires in self._tokens.items() if expires > now}
+        self._versions = {uid: entry for uid, entry in self._versions.items() if entry[1] > now}
+        await db.execute(
+            delete(models.TokenRevocation).where(models.TokenRevocation.expires_at < datetime.utcnow())
+        )
+        await db.commit()
+        self.refreshes += 1
+
+    async def run(self, sessions, interval: float) -> None:
+        """Refresh from the database every `interval` seconds until cancelled."""
+        while True:
+            try:
+                async with sessions() as db:
+                    await self.refresh(db)
+            except Exception:  # keep serving from the last good copy
+                logger.exception("refreshing token revocations failed")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {"tokens": len(self._tokens), "users": len(self._versions), "refreshes": self.refreshes}
@@ -0,0 +1,24 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import schemas
+from ..analytics import Dimension, price_analytics
+from ..database import get_read_db
+from ..metrics import query_budget
+from ..responses import model_response
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+@router.get("/prices", response_model=schemas.PriceStats)
+@query_budget(1)
+async def price_statistics(
+    group_by: List[Dimension] = Query(["type"]),
+    percentiles: List[float] = Query([10, 25, 50, 75, 90], max_length=20),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Price per m² by type, rooms_count and/or owner city, at most ANALYTICS_MAX_AGE_SECONDS old."""
+    if any(not 0 <= q <= 100 for q in percentiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    stats = await price_analytics.prices(db, list(dict.fromkeys(group_by)), percentiles)
+    return model_response(schemas.PriceStats(**stats))
@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config, models
+from ..bulk import (
+    PUBLIC_EXPORT_COLUMNS, ChangedField, FeedFormat, decode_lines, export_query, export_stream, import_stream
+)
+from ..database import get_write_db, read_sessionmaker
+from ..geo import geo_filter
+from ..metrics import query_budget
+from ..security import get_current_user
+from .listings import filter_listings
+
+router = APIRouter(prefix="/shanyraks/bulk", tags=["Bulk"])
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+@router.post("/import", status_code=200)
+@query_budget(None)  # statements grow with the number of batches in the feed
+async def import_listings(
+    request: Request,
+    format: FeedFormat = "ndjson",
+    batch_size: int = Query(config.IMPORT_BATCH_SIZE, ge=1, le=10000),
+    db: AsyncSession = Depends(get_write_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # the body is parsed as it streams in, never held in memory whole
+    return await import_stream(db, current_user.id, format, decode_lines(request.stream()), batch_size)
+
+@router.get("/export")
+@query_budget(2)
+async def export_listings(
+    format: FeedFormat = "ndjson",
+    gzip: bool = False,
+    type: Optional[str] = None,
+    rooms_count: Optional[int] = None,
+    price_from: Optional[int] = None,
+    price_until: Optional[int] = None,
+    bbox: Optional[str] = Query(None, description="west,south,east,north"),
+    changed_since: Optional[datetime] = Query(None, description="only rows changed after this time"),
+    changed_field: ChangedField = "updated_at",
+    sessions=Depends(read_sessionmaker),
+    current_user: models.User = Depends(get_current_user)
+):
+    # every matching listing, for analytics and partner sites; signed-in callers only
+    query = filter_listings(select(models.Listing), type, rooms_count, price_from, price_until)
+    query = geo_filter(query, bbox, None, None, None)
+    query = export_query(query, changed_since, changed_field, PUBLIC_EXPORT_COLUMNS)
+
+    filename = f"listings.{format}.gz" if gzip else f"listings.{format}"
+    return StreamingResponse(
+        export_stream(query, format, gzip, sessions),
+        media_type="application/gzip" if gzip else EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,20 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import orjson
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models, schemas
-from ..database import get_db
+from ..database import get_read_db, get_write_db, read_sessionmaker
+from ..etag import etag_matches, make_etag
+from ..metrics import query_budget
+from ..pagination import encode_cursor, keyset_after
+from ..responses import model_response
 from ..security import get_current_user
 
 router = APIRouter(prefix="/shanyraks", tags=["Comments"])
 
+STREAM_BATCH_SIZE = 500
+
+async def stream_comments(query, sessions):
+    # the request's session is closed before the body is sent, so the
+    # stream opens its own and walks a server-side cursor in batches
+    async with sessions() as db:
+        rows = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for c in rows:
+            yield orjson.dumps(c._asdict(), option=orjson.OPT_APPEND_NEWLINE)
+
 @router.post("/{listing_id}/comments", status_code=200)
-def add_comment(
+@query_budget(3)
+async def add_comment(
     listing_id: int,
     comment_data: schemas.CommentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+    listing = await db.get(models.Listing, listing_id)
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
 
@@ -24,63 +43,93 @@ def add_comment(
         author_id=current_user.id
     )
     db.add(comment)
-    db.commit()
-    db.refresh(comment)
+    await db.commit()
     return {"message": "Comment added successfully"}
 
-@router.get("/{listing_id}/comments", status_code=200)
-def get_comments(listing_id: int, db: Session = Depends(get_db)):
-    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
-    if not listing:
+@router.get("/{listing_id}/comments", response_model=schemas.CommentPage, status_code=200)
+@query_budget(2)
+async def get_comments(
+    listing_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    sessions=Depends(read_sessionmaker),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    if_none_match: Optional[str] = Header(None)
+):
+    revision = await db.scalar(select(models.Listing.revision).where(models.Listing.id == listing_id))
+    if revision is None:
         raise HTTPException(status_code=404, detail="Listing not found")
-
-    comments = db.query(models.Comment).filter(models.Comment.listing_id == listing_id).all()
-    comment_list = []
-    for c in comments:
-        comment_list.append({
-            "id": c.id,
-            "content": c.content,
-            "created_at": c.created_at,
-            "author_id": c.author_id
-        })
-
-    return {"comments": comment_list}
+    etag = make_etag("comments", listing_id, revision, format, limit or "all", cursor or "start")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    query = (
+        select(models.Comment.id, models.Comment.content, models.Comment.created_at, models.Comment.author_id)
+        .where(models.Comment.listing_id == listing_id)
+        .order_by(models.Comment.created_at, models.Comment.id)
+    )
+    if cursor is not None:
+        query = query.where(keyset_after(models.Comment.created_at, models.Comment.id, cursor, descending=False))
+
+    if format == "ndjson":
+        if limit is not None:
+            query = query.limit(limit)
+        return StreamingResponse(
+            stream_comments(query, sessions), media_type="application/x-ndjson", headers={"ETag": etag}
+        )
+
+    # without a limit the whole thread is returned, as before
+    comments = (await db.execute(query if limit is None else query.limit(limit + 1))).all()
+    next_cursor = None
+    if limit is not None and len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = encode_cursor(comments[-1].created_at, comments[-1].id)
+
+    return model_response(
+        schemas.CommentPage(
+            comments=schemas.comment_list.validate_python([c._asdict() for c in comments]),
+            next_cursor=next_cursor
+        ),
+        headers={"ETag": etag}
+    )
 
 @router.patch("/{listing_id}/comments/{comment_id}", status_code=200)
-def update_comment(
+@query_budget(3)
+async def update_comment(
     listing_id: int,
     comment_id: int,
     comment_data: schemas.CommentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    comment = db.query(models.Comment).filter(
+    comment = await db.scalar(select(models.Comment).where(
         models.Comment.id == comment_id,
         models.Comment.listing_id == listing_id
-    ).first()
+    ))
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     if comment.author_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this comment")
 
     comment.content = comment_data.content
-    db.commit()
-    db.refresh(comment)
+    await db.commit()
     return {"message": "Comment updated successfully"}
 
 # app/routers/comments.py
 @router.patch("/{listing_id}/comments/{comment_id}")
-def update_comment(
+@query_budget(3)
+async def update_comment(
     listing_id: int,
     comment_id: int,
     comment_data: schemas.CommentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    comment = db.query(models.Comment).filter(
+    comment = await db.scalar(select(models.Comment).where(
         models.Comment.id == comment_id,
         models.Comment.listing_id == listing_id
-    ).first()
+    ))
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
 
@@ -89,33 +138,33 @@ def update_comment(
         raise HTTPException(status_code=403, detail="Not authorized to update this comment")
 
     comment.content = comment_data.content
-    db.commit()
-    db.refresh(comment)
+    await db.commit()
     return {"message": "Comment updated successfully"}
 
 
 @router.delete("/{listing_id}/comments/{comment_id}")
-def delete_comment(
+@query_budget(4)
+async def delete_comment(
     listing_id: int,
     comment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    comment = db.query(models.Comment).filter(
+    comment = await db.scalar(select(models.Comment).where(
         models.Comment.id == comment_id,
         models.Comment.listing_id == listing_id
-    ).first()
+    ))
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
 
-    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+    listing = await db.get(models.Listing, listing_id)
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
 
     if (comment.author_id != current_user.id) and (listing.user_id != current_user.id):
         raise HTTPException(status_code=403, detail="Not authorized to delete this comment")
 
-    db.delete(comment)
-    db.commit()
+    await db.delete(comment)
+    await db.commit()
     return {"message": "Comment deleted successfully"}
 
@@ -1,68 +1,113 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Iterable, List, Optional, Set
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
+from ..database import get_read_db, get_write_db
+from ..metrics import query_budget
+from ..pagination import encode_cursor, keyset_after
 from ..security import get_current_user
-from .. import models
+from ..responses import model_response
+from .. import models, schemas
 
 router = APIRouter(prefix="/auth/users/favorites", tags=["Favorites"])
 
+async def favorited_ids(db: AsyncSession, user_id: int, listing_ids: Iterable[int]) -> Set[int]:
+    """Which of listing_ids the user has favorited, in one primary-key lookup."""
+    listing_ids = list(listing_ids)
+    if not listing_ids:
+        return set()
+    rows = await db.scalars(
+        select(models.favorites_table.c.listing_id)
+        .where(models.favorites_table.c.user_id == user_id)
+        .where(models.favorites_table.c.listing_id.in_(listing_ids))
+    )
+    return set(rows)
+
 @router.post("/shanyraks/{listing_id}")
-def add_favorite(
+@query_budget(4)
+async def add_favorite(
     listing_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+    listing = await db.get(models.Listing, listing_id)
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
 
-    favorites_assoc = db.execute(
+    favorites_assoc = (await db.execute(
         models.favorites_table.select()
         .where(models.favorites_table.c.user_id == current_user.id)
         .where(models.favorites_table.c.listing_id == listing_id)
-    ).first()
+    )).first()
     if favorites_assoc:
         return {"message": "Already in favorites"}
 
-    db.execute(
+    await db.execute(
         models.favorites_table.insert().values(
             user_id=current_user.id, listing_id=listing_id
         )
     )
-    db.commit()
+    await db.commit()
     return {"message": "Added to favorites"}
 
-@router.get("/shanyraks")
-def get_favorites(
-    db: Session = Depends(get_db),
+@router.get("/shanyraks", response_model=schemas.FavoritePage)
+@query_budget(2)
+async def get_favorites(
+    db: AsyncSession = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
 ):
-    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+    # relationships can't lazy load under AsyncSession, so join explicitly
+    query = (
+        select(models.Listing.id, models.Listing.address, models.Listing.created_at)
+        .join(models.favorites_table, models.favorites_table.c.listing_id == models.Listing.id)
+        .where(models.favorites_table.c.user_id == current_user.id)
+        .order_by(models.Listing.created_at.desc(), models.Listing.id.desc())
+    )
+    if cursor is not None:
+        query = query.where(keyset_after(models.Listing.created_at, models.Listing.id, cursor))
+    # without a limit every favorite is returned, as before pagination existed
+    if limit is not None:
+        query = query.limit(limit + 1)
+    rows = (await db.execute(query)).all()
 
-    favorites_data = []
-    for listing in user.favorites:
-        favorites_data.append({
-            "_id": listing.id,
-            "address": listing.address
-        })
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
 
-    return {"shanyraks": favorites_data}
+    return model_response(schemas.FavoritePage(
+        shanyraks=schemas.favorite_list.validate_python([row._asdict() for row in rows]),
+        next_cursor=next_cursor
+    ))
+
+@router.get("/shanyraks/status")
+@query_budget(2)
+async def get_favorites_status(
+    ids: List[int] = Query(..., max_length=100),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    favorited = await favorited_ids(db, current_user.id, ids)
+    return {"favorites": {str(listing_id): listing_id in favorited for listing_id in ids}}
 
 @router.delete("/shanyraks/{listing_id}")
-def remove_favorite(
+@query_budget(3)
+async def remove_favorite(
     listing_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+    listing = await db.get(models.Listing, listing_id)
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
 
-    db.execute(
+    await db.execute(
         models.favorites_table.delete()
         .where(models.favorites_table.c.user_id == current_user.id)
         .where(models.favorites_table.c.listing_id == listing_id)
     )
-    db.commit()
+    await db.commit()
     return {"message": "Removed from favorites"}
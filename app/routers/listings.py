@@ -1,60 +1,176 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import models, schemas
-from ..database import get_db
-from ..security import get_current_user
+from .. import config, models, schemas
+from ..counting import CountStrategy, count_listings
+from ..database import get_read_db, get_write_db
+from ..etag import etag_matches, make_etag
+from ..facets import Facet, facet_counts
+from ..geo import apply_bbox, cluster_cell_size, geo_filter, parse_bbox
+from ..metrics import query_budget
+from ..pagination import encode_cursor, keyset_after
+from ..responses import model_response
+from ..search import apply_search, fts_query, search_rank
+from ..security import get_current_user, get_optional_user
+from .favorites import favorited_ids
 
 router = APIRouter(prefix="/shanyraks", tags=["Listings"])
 
-@router.get("/")
-def list_shanyraks(
-    db: Session = Depends(get_db),
+# search result cards need only these; created_at is kept for the cursor
+SUMMARY_COLUMNS = (
+    models.Listing.id,
+    models.Listing.type,
+    models.Listing.price,
+    models.Listing.address,
+    models.Listing.area,
+    models.Listing.rooms_count,
+    models.Listing.latitude,
+    models.Listing.longitude,
+    models.Listing.comments_count,
+    models.Listing.created_at,
+)
+
+def filter_listings(query, type, rooms_count, price_from, price_until):
+    if type is not None:
+        query = query.where(models.Listing.type == type)
+    if rooms_count is not None:
+        query = query.where(models.Listing.rooms_count == rooms_count)
+    if price_from is not None:
+        query = query.where(models.Listing.price >= price_from)
+    if price_until is not None:
+        query = query.where(models.Listing.price <= price_until)
+    return query
+
+@router.get("/", response_model=schemas.ListingPage)
+@query_budget(5)
+async def list_shanyraks(
+    db: AsyncSession = Depends(get_read_db),
     limit: int = Query(10, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=200),
     type: Optional[str] = None,
     rooms_count: Optional[int] = None,
     price_from: Optional[int] = None,
     price_until: Optional[int] = None,
+    bbox: Optional[str] = Query(None, description="west,south,east,north"),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0, le=100),
+    count: Optional[CountStrategy] = Query(None, description="default: exact on the first page, cached after it"),
+    with_favorites: bool = False,
+    facets: List[Facet] = Query([], description="counts to return per value of these fields"),
+    current_user: Optional[models.User] = Depends(get_optional_user),
 ):
-    query = db.query(models.Listing)
+    if with_favorites and current_user is None:
+        raise HTTPException(status_code=401, detail="with_favorites requires authentication")
 
-    if type is not None:
-        query = query.filter(models.Listing.type == type)
-    if rooms_count is not None:
-        query = query.filter(models.Listing.rooms_count == rooms_count)
-    if price_from is not None:
-        query = query.filter(models.Listing.price >= price_from)
-    if price_until is not None:
-        query = query.filter(models.Listing.price <= price_until)
+    query = filter_listings(select(*SUMMARY_COLUMNS), type, rooms_count, price_from, price_until)
+    query = geo_filter(query, bbox, lat, lng, radius_km)
 
-    total = query.count()
+    match = fts_query(q) if q is not None else None
+    if match is not None:
+        if cursor is not None:
+            raise HTTPException(status_code=400, detail="Cursor pagination is not available for text search")
+        query = apply_search(query, match)
 
-    query = query.order_by(models.Listing.created_at.desc())
+    filters = {
+        "q": match, "type": type, "rooms_count": rooms_count, "price_from": price_from, "price_until": price_until,
+        "bbox": bbox, "lat": lat, "lng": lng, "radius_km": radius_km,
+    }
+    # a crawl by cursor would otherwise pay for a full filtered COUNT on every page
+    if count is None:
+        count = "exact" if cursor is None else "cached"
+    total = await count_listings(db, query, filters, count)
 
-    listings = query.offset(offset).limit(limit).all()
+    # relevance ranking comes first for text search, recency breaks ties
+    if match is not None:
+        query = query.order_by(search_rank)
+    query = query.order_by(models.Listing.created_at.desc(), models.Listing.id.desc())
 
-    objects = []
-    for lst in listings:
-        objects.append({
-            "_id": lst.id,
-            "type": lst.type,
-            "price": lst.price,
-            "address": lst.address,
-            "area": lst.area,
-            "rooms_count": lst.rooms_count
-        })
+    # with a cursor we seek straight to the page instead of skipping `offset` rows
+    if cursor is not None:
+        query = query.where(keyset_after(models.Listing.created_at, models.Listing.id, cursor))
+    else:
+        query = query.offset(offset)
 
-    return {
+    listings = (await db.execute(query.limit(limit + 1))).all()
+    next_cursor = None
+    if len(listings) > limit:
+        listings = listings[:limit]
+        if match is None:
+            next_cursor = encode_cursor(listings[-1].created_at, listings[-1].id)
+
+    objects = [lst._asdict() for lst in listings]
+    if with_favorites:
+        # one lookup for the whole page instead of a status check per card
+        favorited = await favorited_ids(db, current_user.id, [lst["id"] for lst in objects])
+        for lst in objects:
+            lst["is_favorite"] = lst["id"] in favorited
+
+    page = {
         "total": total,
-        "objects": objects
+        "objects": schemas.listing_summaries.validate_python(objects),
+        "next_cursor": next_cursor,
     }
+    if facets:
+        def scope(query):
+            query = geo_filter(query, bbox, lat, lng, radius_km)
+            return query if match is None else apply_search(query, match)
+
+        # text and geo filters can't be answered from the aggregates
+        narrowed = match is not None or bbox is not None or radius_km is not None
+        page["facets"] = await facet_counts(
+            db, facets, type, rooms_count, price_from, price_until, scope if narrowed else None
+        )
+
+    return model_response(schemas.ListingPage(**page))
+
+@router.get("/map/clusters")
+@query_budget(1)
+async def map_clusters(
+    bbox: str = Query(..., description="west,south,east,north"),
+    zoom: int = Query(..., ge=0, le=22),
+    db: AsyncSession = Depends(get_read_db),
+    type: Optional[str] = None,
+    rooms_count: Optional[int] = None,
+    price_from: Optional[int] = None,
+    price_until: Optional[int] = None,
+):
+    west, south, east, north = parse_bbox(bbox)
+    cell = cluster_cell_size(zoom, config.MAP_CLUSTER_CELLS_PER_TILE)
+    gx = cast((models.Listing.longitude - west) / cell, Integer)
+    gy = cast((models.Listing.latitude - south) / cell, Integer)
+
+    query = select(
+        func.count().label("count"),
+        func.avg(models.Listing.latitude).label("latitude"),
+        func.avg(models.Listing.longitude).label("longitude"),
+        func.min(models.Listing.id).label("id"),
+    ).select_from(models.Listing)
+    query = apply_bbox(query, (west, south, east, north))
+    query = filter_listings(query, type, rooms_count, price_from, price_until)
+    rows = await db.execute(query.group_by(gx, gy))
+
+    clusters = []
+    for row in rows:
+        clusters.append({
+            "count": row.count,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            # a single-listing cell is just a point the client can link to
+            "_id": row.id if row.count == 1 else None
+        })
+
+    return {"cell_size": cell, "clusters": clusters}
 
 @router.post("/", status_code=200)
-def create_listing(
+@query_budget(2)
+async def create_listing(
     listing_data: schemas.ListingCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user)
 ):
     listing = models.Listing(
@@ -64,21 +180,35 @@ def create_listing(
         area=listing_data.area,
         rooms_count=listing_data.rooms_count,
         description=listing_data.description,
+        latitude=listing_data.latitude,
+        longitude=listing_data.longitude,
         user_id=current_user.id
     )
     db.add(listing)
-    db.commit()
-    db.refresh(listing)
+    await db.commit()
     return {"id": listing.id}
 
 @router.get("/{listing_id}", response_model=schemas.ListingOut, status_code=200)
-def get_listing(listing_id: int, db: Session = Depends(get_db)):
-    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
-    if not listing:
+@query_budget(2)
+async def get_listing(
+    listing_id: int,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    if_none_match: Optional[str] = Header(None)
+):
+    # revalidation only needs the revision, not the whole row
+    revision = await db.scalar(select(models.Listing.revision).where(models.Listing.id == listing_id))
+    if revision is None:
         raise HTTPException(status_code=404, detail="Listing not found")
+    etag = make_etag("listing", listing_id, revision)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
 
-    total_comments = db.query(models.Comment).filter(models.Comment.listing_id == listing_id).count()
+    listing = await db.get(models.Listing, listing_id)
+    if not listing:
+        raise HTTPException(status_code=404, detail="Listing not found")
 
+    response.headers["ETag"] = make_etag("listing", listing_id, listing.revision)
     return schemas.ListingOut(
         id=listing.id,
         type=listing.type,
@@ -88,17 +218,20 @@ def get_listing(listing_id: int, db: Session = Depends(get_db)):
         rooms_count=listing.rooms_count,
         description=listing.description,
         user_id=listing.user_id,
-        total_comments=total_comments
+        latitude=listing.latitude,
+        longitude=listing.longitude,
+        total_comments=listing.comments_count
     )
 
 @router.patch("/{listing_id}", status_code=200)
-def update_listing(
+@query_budget(3)
+async def update_listing(
     listing_id: int,
     update_data: schemas.ListingUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+    listing = await db.get(models.Listing, listing_id)
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
     if listing.user_id != current_user.id:
@@ -116,23 +249,31 @@ def update_listing(
         listing.rooms_count = update_data.rooms_count
     if update_data.description is not None:
         listing.description = update_data.description
+    if update_data.latitude is not None:
+        listing.latitude = update_data.latitude
+    if update_data.longitude is not None:
+        listing.longitude = update_data.longitude
 
-    db.commit()
-    db.refresh(listing)
+    # an empty or no-op patch keeps the revision, and with it every ETag
+    if db.is_modified(listing):
+        listing.revision = models.Listing.revision + 1
+        await db.commit()
     return {"message": "Listing updated successfully"}
 
 @router.delete("/{listing_id}", status_code=200)
-def delete_listing(
+@query_budget(3)
+async def delete_listing(
     listing_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+    listing = await db.get(models.Listing, listing_id)
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
     if listing.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this listing")
 
-    db.delete(listing)
-    db.commit()
+    # comments and favorites go with it through ON DELETE CASCADE
+    await db.delete(listing)
+    await db.commit()
     return {"message": "Listing deleted successfully"}
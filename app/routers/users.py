@@ -1,24 +1,28 @@
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from datetime import timedelta
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models, schemas
-from ..database import get_db
+from ..database import get_db, get_write_db
+from ..metrics import query_budget
 from ..security import (
-    get_password_hash, verify_password, create_access_token, get_current_user,
-    ACCESS_TOKEN_EXPIRE_MINUTES
+    hash_password, verify_and_update_password, get_current_user, get_token_claims,
+    credentials_exception, decode_token, issue_tokens, revocation_for, revocations, revoke_all_tokens
 )
 from fastapi.security import OAuth2PasswordRequestForm
 
 router = APIRouter(prefix="/auth/users", tags=["Users"])
 
 @router.post("/", status_code=200)
-def register_user(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.username == user_data.username).first()
+@query_budget(2)
+async def register_user(user_data: schemas.UserCreate, db: AsyncSession = Depends(get_write_db)):
+    existing_user = await db.scalar(select(models.User).where(models.User.username == user_data.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="User with this email already exists.")
 
-    hashed_pw = get_password_hash(user_data.password)
+    hashed_pw = await hash_password(user_data.password)
     new_user = models.User(
         username=user_data.username,
         password_hash=hashed_pw,
@@ -27,29 +31,88 @@ def register_user(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
         city=user_data.city
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
 
     return {"message": "User created successfully"}
 
 @router.post("/login", response_model=schemas.Token, status_code=200)
-def login_user(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+@query_budget(2)
+async def login_user(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.username == form_data.username))
+    if not user:
         raise HTTPException(status_code=400, detail="Invalid username or password")
+    verified, new_hash = await verify_and_update_password(form_data.password, user.password_hash)
+    if not verified:
+        raise HTTPException(status_code=400, detail="Invalid username or password")
+    if new_hash:
+        # stored hash predates the current bcrypt cost
+        user.password_hash = new_hash
+        await db.commit()
 
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username},
-        expires_delta=access_token_expires
-    )
+    return issue_tokens(user.id, user.username, user.token_version)
+
+async def _end_all_sessions(db: AsyncSession, user_id: int):
+    revocation = await revoke_all_tokens(db, user_id)
+    await db.commit()
+    revocations.add(revocation)
+    raise credentials_exception
+
+@router.post("/refresh", response_model=schemas.Token, status_code=200)
+@query_budget(2)
+async def refresh_tokens(data: schemas.TokenRefresh, db: AsyncSession = Depends(get_write_db)):
+    claims = decode_token(data.refresh_token, "refresh")
+    if revocations.version_revoked(claims):
+        raise credentials_exception
+
+    # rotation: each refresh token is spent once. One that comes back was
+    # copied, so every session of the user is ended
+    if revocations.token_revoked(claims):
+        await _end_all_sessions(db, claims["uid"])
+    revocation = revocation_for(claims)
+    db.add(revocation)
+    try:
+        await db.commit()
+    except IntegrityError:  # spent by a concurrent request or another process
+        await db.rollback()
+        await _end_all_sessions(db, claims["uid"])
+    revocations.add(revocation)
+
+    return issue_tokens(claims["uid"], claims["sub"], claims["ver"])
+
+@router.post("/logout", status_code=200)
+@query_budget(2)
+async def logout_user(
+    data: Optional[schemas.TokenRefresh] = None,
+    everywhere: bool = False,
+    db: AsyncSession = Depends(get_write_db),
+    claims: dict = Depends(get_token_claims)
+):
+    """Revoke this access token and the refresh token sent with it; everywhere=true revokes all of the user's tokens."""
+    if "jti" not in claims:
+        raise HTTPException(status_code=400, detail="This token predates logout; it expires on its own")
 
-    return {"access_token": access_token}
+    if everywhere:
+        # the version bump covers this token pair too
+        revoked = [await revoke_all_tokens(db, claims["uid"])]
+    else:
+        revoked = [revocation_for(claims)]
+        if data is not None:
+            refresh_claims = decode_token(data.refresh_token, "refresh")
+            if refresh_claims["uid"] != claims["uid"]:
+                raise HTTPException(status_code=400, detail="Refresh token belongs to another user")
+            if not revocations.token_revoked(refresh_claims):
+                revoked.append(revocation_for(refresh_claims))
+    db.add_all(revoked)
+    await db.commit()
+    for revocation in revoked:
+        revocations.add(revocation)
+    return {"message": "Logged out successfully"}
 
 @router.patch("/me", status_code=200)
-def update_current_user(
+@query_budget(2)
+async def update_current_user(
     update_data: schemas.UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
     current_user: models.User = Depends(get_current_user)
 ):
     if update_data.phone is not None:
@@ -59,13 +122,16 @@ def update_current_user(
     if update_data.city is not None:
         current_user.city = update_data.city
 
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
     return {"message": "User data updated successfully"}
 
 @router.get("/me", response_model=schemas.UserOut, status_code=200)
-def get_current_user_data(
-    db: Session = Depends(get_db),
+@query_budget(1)
+async def get_current_user_data(
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
+    # in stateless auth mode only the id and username come with the token
+    if inspect(current_user).unloaded & schemas.UserOut.model_fields.keys():
+        await db.refresh(current_user)
     return current_user
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, TypeAdapter
+from typing import Dict, Optional, List, Union
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -16,8 +16,7 @@ class UserOut(BaseModel):
     name: Optional[str]
     city: Optional[str]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserUpdate(BaseModel):
     phone: Optional[str] = None
@@ -27,6 +26,10 @@ class UserUpdate(BaseModel):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
 
 
 class ListingCreate(BaseModel):
@@ -34,8 +37,13 @@ class ListingCreate(BaseModel):
     price: int
     address: str
     area: Optional[float] = None
-    rooms_count: Optional[int] = None
+    rooms_count: Optional[int] = Field(None, ge=0)
     description: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class ListingImport(ListingCreate):
+    external_id: str = Field(..., min_length=1)
 
 class ListingOut(BaseModel):
     id: int
@@ -46,18 +54,50 @@ class ListingOut(BaseModel):
     rooms_count: Optional[int]
     description: Optional[str]
     user_id: int
-    total_comments: int = 0  
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    total_comments: int = 0
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class ListingSummary(BaseModel):
+    """One search result card; list endpoints validate these from row dicts."""
+    id: int = Field(serialization_alias="_id")
+    type: str
+    price: int
+    address: str
+    area: Optional[float]
+    rooms_count: Optional[int]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    comments_count: int
+    # only set when the caller asked for with_favorites
+    is_favorite: Optional[bool] = None
+
+class FacetCount(BaseModel):
+    # type and rooms_count facets carry a value, the price facet a bucket's bounds
+    value: Union[str, int, None] = None
+    price_from: Optional[int] = None
+    price_until: Optional[int] = None
+    count: int
+
+class ListingPage(BaseModel):
+    # an int, "10000+" for estimated counts, or None when counting is off
+    total: Union[int, str, None]
+    objects: List[ListingSummary]
+    next_cursor: Optional[str]
+    # only set when the caller asked for facets
+    facets: Optional[Dict[str, List[FacetCount]]] = None
 
 class ListingUpdate(BaseModel):
     type: Optional[str] = None
     price: Optional[int] = None
     address: Optional[str] = None
     area: Optional[float] = None
-    rooms_count: Optional[int] = None
+    rooms_count: Optional[int] = Field(None, ge=0)
     description: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 
 class CommentCreate(BaseModel):
@@ -69,5 +109,39 @@ class CommentOut(BaseModel):
     created_at: datetime
     author_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class CommentPage(BaseModel):
+    comments: List[CommentOut]
+    next_cursor: Optional[str]
+
+
+class FavoriteOut(BaseModel):
+    id: int = Field(serialization_alias="_id")
+    address: str
+
+class FavoritePage(BaseModel):
+    shanyraks: List[FavoriteOut]
+    next_cursor: Optional[str]
+
+
+class PriceGroup(BaseModel):
+    # only the dimensions the caller grouped by are set
+    type: Optional[str] = None
+    rooms_count: Optional[int] = None
+    city: Optional[str] = None
+    count: int
+    mean: float
+    percentiles: Dict[str, float]
+
+class PriceStats(BaseModel):
+    listings: int
+    refreshed_at: datetime
+    groups: List[PriceGroup]
+
+
+# list payloads are validated in one pass from row dicts; validating SQLAlchemy
+# rows with from_attributes goes through Row.__getattr__ and is several times slower
+listing_summaries = TypeAdapter(List[ListingSummary])
+comment_list = TypeAdapter(List[CommentOut])
+favorite_list = TypeAdapter(List[FavoriteOut])
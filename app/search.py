@@ -0,0 +1,58 @@
+import re
+from typing import Optional
+
+from sqlalchemy import DDL, Column, Integer, MetaData, Table, Text, event, literal_column
+
+from . import models
+
+# external-content FTS5 index over listings; the triggers keep it in step with
+# every insert, update and delete, including ones that bypass the ORM
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5("
+    "address, description, content='listings', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS listings_fts_ai AFTER INSERT ON listings BEGIN "
+    "INSERT INTO listings_fts(rowid, address, description) VALUES (new.id, new.address, new.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS listings_fts_ad AFTER DELETE ON listings BEGIN "
+    "INSERT INTO listings_fts(listings_fts, rowid, address, description) "
+    "VALUES ('delete', old.id, old.address, old.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS listings_fts_au AFTER UPDATE OF address, description ON listings BEGIN "
+    "INSERT INTO listings_fts(listings_fts, rowid, address, description) "
+    "VALUES ('delete', old.id, old.address, old.description); "
+    "INSERT INTO listings_fts(rowid, address, description) VALUES (new.id, new.address, new.description); "
+    "END",
+)
+
+for _ddl in FTS_DDL:
+    event.listen(models.Listing.__table__, "after_create", DDL(_ddl))
+
+# not part of Base.metadata: create_all must not try to create it as a plain table
+listings_fts = Table(
+    "listings_fts",
+    MetaData(),
+    Column("rowid", Integer),
+    Column("address", Text),
+    Column("description", Text),
+    Column("rank"),
+)
+
+# bm25 score, lower is better
+search_rank = listings_fts.c.rank
+
+
+def fts_query(q: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def apply_search(query, match: str):
+    """Restrict a Listing select to rows matching an FTS5 query."""
+    return (
+        query.join(listings_fts, listings_fts.c.rowid == models.Listing.id)
+        .where(literal_column("listings_fts").op("MATCH")(match))
+    )
@@ -1,23 +1,49 @@
+import secrets
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 
+from .cache import TTLCache
 from .database import get_db
-from . import models
+from .hashing import HashingPool
+from .revocation import RevocationList
+from . import config, models
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# hashes made with a different cost are flagged for rehash on next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=config.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=config.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=config.BCRYPT_ROUNDS,
+)
+hashing_pool = HashingPool(config.PASSWORD_HASH_WORKERS, config.PASSWORD_HASH_MAX_QUEUE)
 
 SECRET_KEY = "most_secure_secret"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 120 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/users/login")
+# same scheme, but a missing Authorization header yields None instead of a 401
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/users/login", auto_error=False)
+
+# username -> detached snapshot of the User row
+user_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL_SECONDS)
+revocations = RevocationList()
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -25,6 +51,13 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password(password: str) -> str:
+    return await hashing_pool.run(pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; the second item is a fresh hash if the stored one is outdated."""
+    return await hashing_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -34,21 +67,103 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},  
-    )
+def issue_tokens(user_id: int, username: str, token_version: int) -> dict:
+    """A new access and refresh token pair carrying the user's id and token version."""
+    claims = {"sub": username, "uid": user_id, "ver": token_version}
+    return {
+        "access_token": create_access_token(
+            {**claims, "typ": "access", "jti": secrets.token_urlsafe(16)},
+            expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        ),
+        "refresh_token": create_access_token(
+            {**claims, "typ": "refresh", "jti": secrets.token_urlsafe(16)},
+            expires_delta=timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
+        ),
+    }
+
+def decode_token(token: str, token_type: str = "access") -> dict:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         raise credentials_exception
+    # tokens issued before typ was added are access tokens
+    if claims.get("sub") is None or claims.get("typ", "access") != token_type:
+        raise credentials_exception
+    return claims
+
+def revocation_for(claims: dict) -> models.TokenRevocation:
+    """A revocation of this one token, kept until it would have expired anyway."""
+    return models.TokenRevocation(jti=claims["jti"], expires_at=datetime.utcfromtimestamp(claims["exp"]))
+
+async def revoke_all_tokens(db: AsyncSession, user_id: int) -> models.TokenRevocation:
+    """Bump the user's token version, so every token issued so far stops working; the caller commits."""
+    version = await db.scalar(
+        update(models.User).where(models.User.id == user_id)
+        .values(token_version=models.User.token_version + 1)
+        .returning(models.User.token_version)
+    )
+    # tokens with the old version can live no longer than a refresh token
+    revocation = models.TokenRevocation(
+        user_id=user_id, token_version=version,
+        expires_at=datetime.utcnow() + timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    db.add(revocation)
+    return revocation
+
+async def get_token_claims(token: str = Depends(oauth2_scheme)) -> dict:
+    """The verified claims of the caller's access token; checked against revocations without a query."""
+    claims = decode_token(token)
+    if revocations.is_revoked(claims):
+        raise credentials_exception
+    return claims
 
-    user = db.query(models.User).filter(models.User.username == username).first()
+async def get_current_user(db: AsyncSession = Depends(get_db), claims: dict = Depends(get_token_claims)):
+    username = claims["sub"]
+    cached = user_cache.get(username)
+    if cached is not None:
+        # attach a copy to this session without a SELECT, so routes can still modify it
+        return await db.merge(cached, load=False)
+
+    if config.AUTH_MODE == "stateless" and "uid" in claims:
+        # the signed token says who the caller is; the row's other columns are
+        # left unloaded, so a route that needs them loads them with db.refresh()
+        user = models.User(id=claims["uid"], username=username)
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+    user = await db.scalar(select(models.User).where(models.User.username == username))
     if not user:
         raise credentials_exception
+    user_cache.set(username, _snapshot(user))
     return user
+
+
+async def get_optional_user(db: AsyncSession = Depends(get_db), token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """The caller if a token was sent, else None; a bad token is still a 401."""
+    if token is None:
+        return None
+    return await get_current_user(db, await get_token_claims(token))
+
+
+def _snapshot(user: models.User) -> models.User:
+    copy = models.User(**{column.key: getattr(user, column.key) for column in models.User.__table__.columns})
+    make_transient_to_detached(copy)
+    return copy
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, models.User):
+            session.info.setdefault("changed_usernames", set()).add(obj.username)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_user_cache(session):
+    for username in session.info.pop("changed_usernames", ()):
+        user_cache.pop(username)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_usernames", None)
@@ -0,0 +1,193 @@
+"""Generate large synthetic datasets for capacity testing.
+
+    python -m app.seed --users 1000000 --listings 5000000 --comments 50000000
+
+Rows are written with Core executemany inserts, one transaction per chunk.
+Every chunk draws from its own RNG seeded with (seed, table, chunk number),
+so a chunk's rows are the same whichever run produces them. Ids are
+assigned explicitly, which is what makes runs resumable: an interrupted
+run is picked up from the last committed chunk of each table, found from
+the table's max(id). Seed into an empty database, and resume with the same
+sizes, --seed and --chunk-size.
+
+Distributions are skewed the way real traffic is: a few agencies own most
+listings, a few listings collect most comments, most listings are in the
+big cities, and prices are log-normal. Every user gets the same password
+(--password), hashed once up front instead of once per row.
+
+The FTS, R*Tree, facet, count-generation and comment-count triggers stay active, so the generated
+database is consistent without any rebuild step. For a throwaway database,
+SQLITE_SYNCHRONOUS=OFF speeds the inserts up considerably.
+"""
+import argparse
+import math
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from . import counting, facets, geo, models, search  # noqa: F401  (these register their trigger DDL)
+from .database import Base, engine
+from .security import get_password_hash
+
+START = datetime(2024, 1, 1)
+END = datetime(2026, 10, 1)
+
+# (name, share of listings and users, centre latitude, centre longitude, price multiplier)
+CITIES = [
+    ("Almaty", 0.34, 43.2383, 76.9456, 1.0),
+    ("Astana", 0.26, 51.1282, 71.4307, 0.95),
+    ("Shymkent", 0.10, 42.3417, 69.5901, 0.6),
+    ("Karaganda", 0.07, 49.8047, 73.1094, 0.5),
+    ("Aktobe", 0.06, 50.2839, 57.1670, 0.5),
+    ("Atyrau", 0.05, 47.0945, 51.9238, 0.7),
+    ("Pavlodar", 0.05, 52.2873, 76.9674, 0.45),
+    ("Oskemen", 0.04, 49.9483, 82.6279, 0.45),
+    ("Kostanay", 0.03, 53.2144, 63.6246, 0.4),
+]
+CITY_WEIGHTS = [city[1] for city in CITIES]
+STREETS = ["Abay", "Dostyk", "Tole bi", "Satpayev", "Al-Farabi", "Zhibek Zholy", "Kabanbay Batyr", "Nazarbayev",
+           "Furmanov", "Seifullin", "Raiymbek", "Timiryazev", "Gagarin", "Rozybakiev", "Zhandosov"]
+ROOMS_WEIGHTS = [0.22, 0.36, 0.26, 0.11, 0.05]
+PHRASES = ["евроремонт", "новостройка", "рядом метро", "с мебелью", "вид на горы", "паркинг", "балкон",
+           "тихий двор", "после ремонта", "у парка", "школа рядом", "без посредников"]
+COMMENTS = ["Ещё актуально?", "Какой этаж?", "Можно посмотреть завтра?", "Торг уместен?", "Есть парковка?",
+            "Is it still available?", "Можно с животными?", "Какие коммунальные платежи?"]
+
+# skew exponents: higher means more of the mass on the most popular rows
+OWNER_SKEW = 3.0
+AUTHOR_SKEW = 2.0
+LISTING_POPULARITY_SKEW = 3.0
+# prime, so multiplying by it permutes 1..n for any n it does not divide
+SCATTER_PRIME = 2654435761
+
+
+def skewed_id(rng: random.Random, n: int, skew: float) -> int:
+    """An id in 1..n, heavily favouring a popular few.
+
+    Draws a power-law rank and scatters it over the id space with a fixed
+    multiplicative permutation, so popular rows are not just the oldest ones.
+    """
+    rank = int(n * rng.random() ** skew)
+    return (rank * SCATTER_PRIME) % n + 1
+
+
+def created_at_for(id: int, total: int) -> datetime:
+    """Creation time spread evenly over [START, END) in id order, as ids would be assigned."""
+    return START + (END - START) * ((id - 1) / max(total, 1))
+
+
+def user_rows(rng, first_id, last_id, password_hash):
+    rows = []
+    for id in range(first_id, last_id + 1):
+        rows.append({
+            "id": id,
+            "username": f"user{id}@seed.shanyraq.kz",
+            "password_hash": password_hash,
+            "phone": f"+7 7{rng.randrange(0, 10 ** 9):09d}" if rng.random() < 0.7 else None,
+            "name": f"User {id}" if rng.random() < 0.8 else None,
+            "city": rng.choices(CITIES, CITY_WEIGHTS)[0][0],
+        })
+    return rows
+
+
+def listing_rows(rng, first_id, last_id, total, users):
+    rows = []
+    for id in range(first_id, last_id + 1):
+        city, _, lat, lng, multiplier = rng.choices(CITIES, CITY_WEIGHTS)[0]
+        rooms = rng.choices(range(1, 6), ROOMS_WEIGHTS)[0]
+        area = round(rng.lognormvariate(math.log(22 + 20 * rooms), 0.2), 1)
+        rent = rng.random() < 0.6
+        # tenge: monthly rent or sale price, log-normal around a per-m² rate
+        per_m2 = rng.lognormvariate(math.log(3500 if rent else 550000), 0.35) * multiplier
+        created_at = created_at_for(id, total)
+        rows.append({
+            "id": id,
+            "type": "rent" if rent else "sale",
+            "price": int(area * per_m2 / 1000) * 1000,
+            "address": f"{city}, {rng.choice(STREETS)} {rng.randint(1, 300)}",
+            "area": area,
+            "rooms_count": rooms,
+            "description": ", ".join(rng.sample(PHRASES, rng.randint(1, 4))) if rng.random() < 0.9 else None,
+            "user_id": skewed_id(rng, users, OWNER_SKEW),
+            "latitude": round(rng.gauss(lat, 0.04), 6),
+            "longitude": round(rng.gauss(lng, 0.05), 6),
+            "created_at": created_at,
+            "updated_at": created_at,
+        })
+    return rows
+
+
+def comment_rows(rng, first_id, last_id, listings, users):
+    rows = []
+    for id in range(first_id, last_id + 1):
+        listing_id = skewed_id(rng, listings, LISTING_POPULARITY_SKEW)
+        listed_at = created_at_for(listing_id, listings)
+        rows.append({
+            "id": id,
+            "content": rng.choice(COMMENTS),
+            "created_at": listed_at + (END - listed_at) * rng.random() ** 3,
+            "listing_id": listing_id,
+            "author_id": skewed_id(rng, users, AUTHOR_SKEW),
+        })
+    # inserting in listing order keeps the count trigger's updates local
+    rows.sort(key=lambda row: row["listing_id"])
+    return rows
+
+
+def seed_table(table, total, chunk_size, seed, make_rows):
+    """Insert ids 1..total in chunks, skipping chunks an earlier run committed."""
+    with engine.connect() as conn:
+        done = conn.scalar(select(func.coalesce(func.max(table.c.id), 0)))
+    if done >= total:
+        print(f"{table.name}: already seeded ({done} rows)")
+        return
+    first_chunk = done // chunk_size
+    chunks = math.ceil(total / chunk_size)
+
+    started = time.perf_counter()
+    for chunk in range(first_chunk, chunks):
+        rng = random.Random(f"{seed}:{table.name}:{chunk}")
+        first_id = chunk * chunk_size + 1
+        last_id = min(total, first_id + chunk_size - 1)
+        # a run with a smaller total may have left this chunk partly written
+        rows = [row for row in make_rows(rng, first_id, last_id) if row["id"] > done]
+        with engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+        rate = (last_id - done) / (time.perf_counter() - started)
+        print(f"{table.name}: {last_id}/{total} ({rate:,.0f} rows/s)", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.seed")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--listings", type=int, default=50000)
+    parser.add_argument("--comments", type=int, default=500000)
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows per insert transaction; keep it the same when resuming")
+    parser.add_argument("--seed", type=int, default=0, help="same seed and sizes, same data")
+    parser.add_argument("--password", default="password", help="shared password for every seeded user")
+    args = parser.parse_args(argv)
+
+    if args.listings and not args.users or args.comments and not args.listings:
+        parser.error("listings need users and comments need listings")
+
+    Base.metadata.create_all(bind=engine)
+    password_hash = get_password_hash(args.password)
+
+    seed_table(
+        models.User.__table__, args.users, args.chunk_size, args.seed,
+        lambda rng, first, last: user_rows(rng, first, last, password_hash),
+    )
+    seed_table(
+        models.Listing.__table__, args.listings, args.chunk_size, args.seed,
+        lambda rng, first, last: listing_rows(rng, first, last, args.listings, args.users),
+    )
+    seed_table(
+        models.Comment.__table__, args.comments, args.chunk_size, args.seed,
+        lambda rng, first, last: comment_rows(rng, first, last, args.listings, args.users),
+    )
+
+
+if __name__ == "__main__":
+    main()
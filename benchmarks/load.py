@@ -0,0 +1,318 @@
+"""Concurrent mixed-workload latency benchmark for the HTTP API.
+
+Seeds a scratch database, then runs a weighted mix of search, detail,
+comment, login and favorites requests from concurrent clients and reports
+throughput and p50/p95/p99 latency per endpoint. By default the app is
+driven in-process through httpx's ASGI transport; --uvicorn runs it in a
+local uvicorn worker instead so sockets and HTTP parsing are included.
+
+Results can be saved as a JSON baseline and later runs compared against
+it; the run fails if any endpoint's p95 or p99 regresses past --threshold:
+
+    PYTHONPATH=/path/to/repo python -m benchmarks.load --save-baseline baseline.json
+    PYTHONPATH=/path/to/repo python -m benchmarks.load --baseline baseline.json --threshold 0.2
+
+Both modes run in a temporary working directory, so ./database.db there is
+a scratch database and the repository's own is never touched.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+PASSWORD = "load-test-password"
+
+SEARCHES = [
+    {},
+    {"type": "rent"},
+    {"rooms_count": 2, "price_until": 300000},
+    {"type": "sale", "price_from": 20000000},
+    {"q": "abay"},
+    {"bbox": "76.85,43.20,76.95,43.30"},
+    {"lat": 43.25, "lng": 76.9, "radius_km": 3},
+    {"count": "estimate", "limit": 20},
+]
+
+DEFAULT_WEIGHTS = {
+    "search": 40,
+    "detail": 25,
+    "comments": 10,
+    "comment_post": 8,
+    "favorites": 8,
+    "favorite_toggle": 5,
+    "login": 4,
+}
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random):
+        self.client = client
+        self.rng = rng
+        self.users = []
+        self.listing_ids = []
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def seed(self, users: int, listings: int, comments: int) -> None:
+        for i in range(users):
+            username = f"load{i}@example.kz"
+            await self.client.post("/auth/users/", json={"username": username, "password": PASSWORD})
+            token = (await self.client.post(
+                "/auth/users/login", data={"username": username, "password": PASSWORD}
+            )).json()["access_token"]
+            self.users.append((username, {"Authorization": f"Bearer {token}"}))
+
+        for i in range(listings):
+            _, headers = self.rng.choice(self.users)
+            response = await self.client.post("/shanyraks/", json={
+                "type": self.rng.choice(["rent", "sale"]),
+                "price": self.rng.randrange(80000, 60000000, 1000),
+                "address": f"{self.rng.choice(['Abay', 'Dostyk', 'Tole bi', 'Satpayev'])} {i}",
+                "area": self.rng.uniform(25, 180),
+                "rooms_count": self.rng.randint(1, 5),
+                "description": "Load test listing",
+                "latitude": self.rng.uniform(43.18, 43.32),
+                "longitude": self.rng.uniform(76.80, 77.00),
+            }, headers=headers)
+            self.listing_ids.append(response.json()["id"])
+
+        for _ in range(comments):
+            _, headers = self.rng.choice(self.users)
+            await self.client.post(
+                f"/shanyraks/{self.rng.choice(self.listing_ids)}/comments",
+                json={"content": "Seeded comment"}, headers=headers,
+            )
+
+    async def request(self, name: str) -> None:
+        rng = self.rng
+        username, headers = rng.choice(self.users)
+        listing_id = rng.choice(self.listing_ids)
+
+        start = time.perf_counter()
+        if name == "search":
+            response = await self.client.get("/shanyraks/", params=rng.choice(SEARCHES))
+        elif name == "detail":
+            response = await self.client.get(f"/shanyraks/{listing_id}")
+        elif name == "comments":
+            response = await self.client.get(f"/shanyraks/{listing_id}/comments", params={"limit": 20})
+        elif name == "comment_post":
+            response = await self.client.post(
+                f"/shanyraks/{listing_id}/comments", json={"content": "Load test comment"}, headers=headers
+            )
+        elif name == "favorites":
+            response = await self.client.get("/auth/users/favorites/shanyraks", params={"limit": 20}, headers=headers)
+        elif name == "favorite_toggle":
+            method = self.client.post if rng.random() < 0.5 else self.client.delete
+            response = await method(f"/auth/users/favorites/shanyraks/{listing_id}", headers=headers)
+        elif name == "login":
+            response = await self.client.post("/auth/users/login", data={"username": username, "password": PASSWORD})
+        else:
+            raise ValueError(f"unknown endpoint {name!r}")
+        elapsed = time.perf_counter() - start
+
+        self.latencies[name].append(elapsed)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+
+    async def run(self, weights: dict, concurrency: int, duration: float) -> float:
+        names, cum_weights = list(weights), []
+        total = 0
+        for name in names:
+            total += weights[name]
+            cum_weights.append(total)
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self.request(self.rng.choices(names, cum_weights=cum_weights)[0])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            values.sort()
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "rps": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+        requests = sum(e["requests"] for e in endpoints.values())
+        return {"elapsed_s": round(elapsed, 2), "requests": requests, "rps": round(requests / elapsed, 1), "endpoints": endpoints}
+
+
+def compare(report: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    """Endpoints whose p95/p99 grew by more than threshold (and min_delta_ms) over the baseline."""
+    regressions = []
+    for name, current in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            limit = before[key] * (1 + threshold)
+            # sub-millisecond jitter on fast endpoints is not a regression
+            if current[key] > limit and current[key] - before[key] >= min_delta_ms:
+                regressions.append(f"{name} {key}: {before[key]:.2f} -> {current[key]:.2f} (limit {limit:.2f})")
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    print(f"{'endpoint':<18}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, e in report["endpoints"].items():
+        print(
+            f"{name:<18}{e['requests']:>9}{e['errors']:>8}{e['rps']:>9.1f}"
+            f"{e['p50_ms']:>9.2f}{e['p95_ms']:>9.2f}{e['p99_ms']:>9.2f}"
+        )
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s, {report['rps']} req/s")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_uvicorn(port: int) -> subprocess.Popen:
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo, os.environ.get("PYTHONPATH")])))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+            return server
+        except httpx.TransportError:
+            if server.poll() is not None:
+                raise SystemExit("uvicorn exited during startup")
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("uvicorn did not start within 30s")
+
+
+async def run(args, client: httpx.AsyncClient) -> dict:
+    workload = Workload(client, random.Random(args.seed))
+    await workload.seed(args.users, args.listings, args.comments)
+    if args.warmup:
+        await workload.run(args.weights, args.concurrency, args.warmup)
+        workload.latencies.clear()
+        workload.errors.clear()
+    elapsed = await workload.run(args.weights, args.concurrency, args.duration)
+    return workload.report(elapsed)
+
+
+def parse_weights(value: str) -> dict:
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, value.split(",")):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_WEIGHTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}")
+        weights[name] = int(weight)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    parser.add_argument("--uvicorn", action="store_true", help="serve the app from a local uvicorn process")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of unmeasured load first")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--listings", type=int, default=2000)
+    parser.add_argument("--comments", type=int, default=2000)
+    parser.add_argument("--weights", type=parse_weights, default=dict(DEFAULT_WEIGHTS),
+                        help="override the mix, e.g. search=60,login=0")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bcrypt-rounds", type=int, help="BCRYPT_ROUNDS for the app under test")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="keep RATE_LIMIT_PER_SECOND from the environment; every simulated client shares one address")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95/p99 growth, as a fraction")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore regressions smaller than this")
+    parser.add_argument("--save-baseline", help="write this run's report here")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+
+    if args.bcrypt_rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    if not args.rate_limit:
+        os.environ["RATE_LIMIT_PER_SECOND"] = "0"
+    # the app opens ./database.db, so give it a scratch directory
+    os.chdir(tempfile.mkdtemp(prefix="shanyraq-load-"))
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.uvicorn:
+        port = free_port()
+        server = start_uvicorn(port)
+        try:
+            async def over_http():
+                async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+                    return await run(args, client)
+            report = asyncio.run(over_http())
+        finally:
+            server.terminate()
+            server.wait()
+    else:
+        from app.main import app
+
+        async def in_process():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=60) as client:
+                return await run(args, client)
+        report = asyncio.run(in_process())
+
+    report["mode"] = "uvicorn" if args.uvicorn else "asgi"
+    report["concurrency"] = args.concurrency
+    print_report(report)
+
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {save_path}")
+
+    if baseline is not None:
+        for key in ("mode", "concurrency"):
+            if baseline.get(key) != report[key]:
+                print(f"\nwarning: baseline {key} is {baseline.get(key)!r}, this run used {report[key]!r}")
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regressions past {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nno regressions past {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Check every route against the SQL statement budget it declares.
+
+Each endpoint carries @query_budget(n). This drives every route in-process
+with QUERY_BUDGET_MODE=raise, so a statement past the budget fails the
+request, and counts each call's statements with count_queries(). The user
+cache is cleared before every call so authenticated routes are measured
+cold. It fails if any route has no budget, was not exercised, errored or
+went over budget:
+
+    PYTHONPATH=/path/to/repo python -m benchmarks.query_budgets
+
+tests/test_query_budgets.py runs the same exercise under pytest.
+
+It runs in a temporary working directory, so the app's ./database.db is a
+scratch database.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from collections import defaultdict
+
+import httpx
+
+os.environ["QUERY_BUDGET_MODE"] = "raise"
+# every call comes from one in-process client
+os.environ["RATE_LIMIT_PER_SECOND"] = "0"
+os.chdir(tempfile.mkdtemp(prefix="shanyraq-budgets-"))
+
+from fastapi.routing import APIRoute  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.metrics import count_queries  # noqa: E402
+from app.security import user_cache  # noqa: E402
+
+
+class Recorder:
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.counts = defaultdict(list)
+        self.failures = []
+
+    async def __call__(self, method: str, url: str, **kwargs) -> httpx.Response:
+        user_cache.clear()
+        with count_queries() as stats:
+            response = await self.client.request(method, url, **kwargs)
+            await response.aread()
+        route = stats_route(method, url)
+        self.counts[route].append(stats.queries)
+        if response.status_code >= 500:
+            self.failures.append(f"{method} {url}: {response.status_code} {response.text[:200]}")
+        return response
+
+
+def stats_route(method: str, url: str):
+    path = httpx.URL(url).path
+    for route in app.routes:
+        if isinstance(route, APIRoute) and method in route.methods and route.path_regex.match(path):
+            return method, route.path
+    return method, path
+
+
+async def exercise(call: Recorder) -> None:
+    await call("POST", "/auth/users/", json={"username": "budget@example.kz", "password": "secret"})
+    await call("POST", "/auth/users/", json={"username": "other@example.kz", "password": "secret"})
+    token = (await call(
+        "POST", "/auth/users/login", data={"username": "budget@example.kz", "password": "secret"}
+    )).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    await call("GET", "/auth/users/me", headers=headers)
+    await call("PATCH", "/auth/users/me", json={"city": "Almaty"}, headers=headers)
+
+    ids = []
+    for i in range(3):
+        ids.append((await call("POST", "/shanyraks/", json={
+            "type": "rent", "price": 150000 + i, "address": f"Abay {i}", "rooms_count": 2,
+            "latitude": 43.25, "longitude": 76.91,
+        }, headers=headers)).json()["id"])
+    listing_id = ids[0]
+
+    for params in [
+        {}, {"type": "rent", "rooms_count": 2}, {"q": "abay"}, {"bbox": "76.8,43.2,77.0,43.3"},
+        {"lat": 43.25, "lng": 76.9, "radius_km": 2}, {"count": "estimate"}, {"count": "cached"},
+        {"with_favorites": True}, {"facets": ["type", "rooms_count", "price"]},
+        {"facets": ["type", "price"], "q": "abay", "price_from": 123456},
+        {"facets": ["rooms_count"], "with_favorites": True},
+    ]:
+        await call("GET", "/shanyraks/", params=params, headers=headers)
+    page = (await call("GET", "/shanyraks/", params={"limit": 1})).json()
+    await call("GET", "/shanyraks/", params={"limit": 1, "cursor": page["next_cursor"]})
+    await call("GET", "/shanyraks/map/clusters", params={"bbox": "76.8,43.2,77.0,43.3", "zoom": 12})
+
+    await call("GET", f"/shanyraks/{listing_id}")
+    etag = (await call("GET", f"/shanyraks/{listing_id}")).headers["etag"]
+    await call("GET", f"/shanyraks/{listing_id}", headers={"If-None-Match": etag})
+    await call("PATCH", f"/shanyraks/{listing_id}", json={"price": 160000}, headers=headers)
+
+    for text in ("Nice", "Second"):
+        await call("POST", f"/shanyraks/{listing_id}/comments", json={"content": text}, headers=headers)
+    comments = (await call("GET", f"/shanyraks/{listing_id}/comments")).json()["comments"]
+    await call("GET", f"/shanyraks/{listing_id}/comments", params={"limit": 1})
+    await call("GET", f"/shanyraks/{listing_id}/comments", params={"format": "ndjson"})
+    await call("PATCH", f"/shanyraks/{listing_id}/comments/{comments[0]['id']}", json={"content": "Great"}, headers=headers)
+    await call("DELETE", f"/shanyraks/{listing_id}/comments/{comments[1]['id']}", headers=headers)
+
+    for favorite in ids[:2]:
+        await call("POST", f"/auth/users/favorites/shanyraks/{favorite}", headers=headers)
+    await call("POST", f"/auth/users/favorites/shanyraks/{ids[0]}", headers=headers)
+    await call("GET", "/auth/users/favorites/shanyraks", headers=headers)
+    await call("GET", "/auth/users/favorites/shanyraks", params={"limit": 1}, headers=headers)
+    await call("GET", "/auth/users/favorites/shanyraks/status", params={"ids": ids}, headers=headers)
+    await call("DELETE", f"/auth/users/favorites/shanyraks/{ids[1]}", headers=headers)
+
+    feed = "".join(
+        f'{{"external_id": "e{i}", "type": "sale", "price": {i + 1}, "address": "Dostyk {i}"}}\n' for i in range(5)
+    )
+    await call("POST", "/shanyraks/bulk/import", params={"batch_size": 2}, content=feed, headers=headers)
+    await call("GET", "/shanyraks/bulk/export", headers=headers)
+    await call("GET", "/shanyraks/bulk/export", params={"format": "csv", "changed_since": "2020-01-01T00:00:00"},
+               headers=headers)
+
+    await call("GET", "/analytics/prices", params={"group_by": ["type", "rooms_count", "city"]})
+    await call("GET", "/analytics/prices", params={"percentiles": [50]})
+
+    await call("DELETE", f"/shanyraks/{ids[2]}", headers=headers)
+
+    # refresh token rotation, a spent refresh token coming back, and both kinds of logout
+    tokens = (await call(
+        "POST", "/auth/users/login", data={"username": "other@example.kz", "password": "secret"}
+    )).json()
+    rotated = (await call("POST", "/auth/users/refresh", json={"refresh_token": tokens["refresh_token"]})).json()
+    await call("POST", "/auth/users/refresh", json={"refresh_token": tokens["refresh_token"]})
+    await call("POST", "/auth/users/refresh", json={"refresh_token": rotated["refresh_token"]})
+    tokens = (await call(
+        "POST", "/auth/users/login", data={"username": "other@example.kz", "password": "secret"}
+    )).json()
+    tokens = (await call("POST", "/auth/users/refresh", json={"refresh_token": tokens["refresh_token"]})).json()
+    await call("POST", "/auth/users/logout", json={"refresh_token": tokens["refresh_token"]},
+               headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    await call("POST", "/auth/users/logout", params={"everywhere": True}, headers=headers)
+    await call("GET", "/stats")
+    await call("GET", "/metrics")
+
+
+async def run() -> Recorder:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://budgets") as client:
+        recorder = Recorder(client)
+        await exercise(recorder)
+    return recorder
+
+
+def budget_rows(recorder: Recorder):
+    """(method, path, budget, declared, counts) for every route of the app."""
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        declared = hasattr(route.endpoint, "__query_budget__")
+        # @query_budget(None) marks a route whose statement count grows with its input by design
+        budget = getattr(route.endpoint, "__query_budget__", None)
+        for method in sorted(route.methods):
+            yield method, route.path, budget, declared, recorder.counts.get((method, route.path))
+
+
+def budget_problems(recorder: Recorder) -> list:
+    problems = list(recorder.failures)
+    for method, path, budget, declared, counts in budget_rows(recorder):
+        if not declared:
+            problems.append(f"{method} {path}: no @query_budget")
+        elif counts is None:
+            problems.append(f"{method} {path}: not exercised")
+        elif budget is not None and max(counts) > budget:
+            problems.append(f"{method} {path}: ran {max(counts)} statements, budget {budget}")
+    return problems
+
+
+def main() -> int:
+    recorder = asyncio.run(run())
+
+    print(f"{'route':<58}{'budget':>8}{'max':>6}{'calls':>7}")
+    for method, path, budget, declared, counts in budget_rows(recorder):
+        observed = max(counts) if counts else "-"
+        shown = budget if budget is not None else "any" if declared else "-"
+        print(f"{method + ' ' + path:<58}{shown:>8}{observed:>6}{len(counts or ()):>7}")
+
+    problems = budget_problems(recorder)
+    if problems:
+        print(f"\n{len(problems)} problems:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print("\nevery route within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Check that every SQL statement issued by the API is served by an index.
+
+Exercises each route against a scratch SQLite database, records the
+statements it runs and fails if EXPLAIN QUERY PLAN reports a full table
+scan for any of them:
+
+    PYTHONPATH=/path/to/repo python -m benchmarks.query_plans
+
+It runs in a temporary working directory, so the app's ./database.db is a
+scratch database.
+"""
+import os
+import re
+import sys
+import tempfile
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+# every request comes from the one test client
+os.environ["RATE_LIMIT_PER_SECOND"] = "0"
+os.chdir(tempfile.mkdtemp(prefix="shanyraq-plans-"))
+
+from app.database import Base, configure_sqlite_connection, get_db, read_sessionmaker  # noqa: E402
+from app.main import app  # noqa: E402
+
+# a table walked end to end, in rowid order or along an index
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?$")
+TEMP_SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+# statements that read or sort every matching row by design: reported with
+# the reason instead of failing
+EXPECTED = [(re.compile(pattern), reason) for pattern, reason in (
+    (r"^SELECT \(SELECT listings_generation\.generation FROM listings_generation\) AS anon_1, count\(\*\) AS count_1 "
+     r"FROM listings$", "exact total of every listing"),
+    (r"coalesce\(listings\.rooms_count, \?\) AS coalesce_1, CASE .* GROUP BY", "live facet counts"),
+    (r"WHERE listings\.area > \? ORDER BY listings\.created_at, listings\.id$", "analytics snapshot rebuild"),
+    (r"FROM listings ORDER BY listings\.(?:created|updated)_at, listings\.id$", "unfiltered bulk export"),
+    (r"JOIN favorites .* WHERE favorites\.user_id = \?", "one user's favorites, sorted by listing date"),
+    # a range can't share an index with the page order; which of a range seek plus
+    # a sort or a walk in date order is cheaper depends on how much of the range matches
+    (r"WHERE .*listings\.price [<>]= \? .*ORDER BY listings\.created_at DESC, listings\.id DESC LIMIT",
+     "price range, matches sorted"),
+)]
+
+
+def exercise(client: TestClient) -> None:
+    client.post("/auth/users/", json={"username": "plan@example.kz", "password": "secret"})
+    token = client.post(
+        "/auth/users/login", data={"username": "plan@example.kz", "password": "secret"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    client.get("/auth/users/me", headers=headers)
+    client.patch("/auth/users/me", json={"city": "Almaty"}, headers=headers)
+
+    # enough listings matching every search below for a page of one to have a next page
+    listing_ids = [
+        client.post(
+            "/shanyraks/",
+            json={
+                "type": "rent", "price": 150000 + i, "address": f"Abay {i}", "rooms_count": 2,
+                "latitude": 43.25, "longitude": 76.91,
+            },
+            headers=headers,
+        ).json()["id"]
+        for i in range(3)
+    ]
+    listing_id = listing_ids[0]
+
+    searches = [
+        {},
+        {"type": "rent"},
+        {"rooms_count": 2},
+        {"price_from": 100000},
+        {"price_from": 100000, "price_until": 200000},
+        {"type": "rent", "rooms_count": 2},
+        {"type": "rent", "price_until": 200000},
+        {"rooms_count": 2, "price_from": 100000},
+        {"type": "rent", "rooms_count": 2, "price_from": 100000, "price_until": 200000},
+    ]
+    for params in [
+        {"q": "abay"},
+        {"q": "abay", "type": "rent", "price_until": 200000},
+        {"bbox": "76.8,43.2,77.0,43.3"},
+        {"lat": 43.25, "lng": 76.9, "radius_km": 2, "rooms_count": 2},
+    ]:
+        client.get("/shanyraks/", params=params)
+    client.get("/shanyraks/map/clusters", params={"bbox": "76.8,43.2,77.0,43.3", "zoom": 12})
+    # facets: from the aggregates, then live for price bounds off the bucket edges, text and geo
+    facets = ["type", "rooms_count", "price"]
+    for params in [{}, {"price_from": 123456}, {"q": "abay"}, {"bbox": "76.8,43.2,77.0,43.3", "type": "rent"}]:
+        client.get("/shanyraks/", params={**params, "facets": facets})
+
+    for params in searches:
+        page = client.get("/shanyraks/", params={**params, "limit": 1}).json()
+        assert page["next_cursor"] is not None, params
+        client.get("/shanyraks/", params={**params, "cursor": page["next_cursor"], "count": "estimate"})
+
+    client.get(f"/shanyraks/{listing_id}")
+    client.patch(f"/shanyraks/{listing_id}", json={"price": 160000}, headers=headers)
+
+    client.post(f"/shanyraks/{listing_id}/comments", json={"content": "Nice"}, headers=headers)
+    comment_id = client.get(f"/shanyraks/{listing_id}/comments").json()["comments"][0]["id"]
+    client.post(f"/shanyraks/{listing_id}/comments", json={"content": "Second"}, headers=headers)
+    page = client.get(f"/shanyraks/{listing_id}/comments", params={"limit": 1}).json()
+    assert page["next_cursor"] is not None
+    client.get(f"/shanyraks/{listing_id}/comments", params={"limit": 1, "cursor": page["next_cursor"]})
+    client.get(f"/shanyraks/{listing_id}/comments", params={"format": "ndjson"})
+    client.patch(f"/shanyraks/{listing_id}/comments/{comment_id}", json={"content": "Great"}, headers=headers)
+    client.delete(f"/shanyraks/{listing_id}/comments/{comment_id}", headers=headers)
+
+    for favorite in listing_ids[:2]:
+        client.post(f"/auth/users/favorites/shanyraks/{favorite}", headers=headers)
+    page = client.get("/auth/users/favorites/shanyraks", params={"limit": 1}, headers=headers).json()
+    assert page["next_cursor"] is not None
+    client.get("/auth/users/favorites/shanyraks", params={"limit": 1, "cursor": page["next_cursor"]}, headers=headers)
+    client.get("/auth/users/favorites/shanyraks/status", params={"ids": [listing_id]}, headers=headers)
+    client.get("/shanyraks/", params={"with_favorites": True}, headers=headers)
+    client.delete(f"/auth/users/favorites/shanyraks/{listing_id}", headers=headers)
+
+    client.get("/analytics/prices", params={"group_by": ["type", "city"]})
+
+    for params in [{}, {"type": "rent", "rooms_count": 2}, {"format": "csv", "changed_since": "2020-01-01T00:00:00"}]:
+        client.get("/shanyraks/bulk/export", params=params, headers=headers)
+
+    client.delete(f"/shanyraks/{listing_id}", headers=headers)
+
+    refresh_token = client.post(
+        "/auth/users/login", data={"username": "plan@example.kz", "password": "secret"}
+    ).json()["refresh_token"]
+    tokens = client.post("/auth/users/refresh", json={"refresh_token": refresh_token}).json()
+    client.post("/auth/users/refresh", json={"refresh_token": refresh_token})
+    client.post("/auth/users/logout", params={"everywhere": True}, json={"refresh_token": tokens["refresh_token"]},
+                headers={"Authorization": f"Bearer {tokens['access_token']}"})
+
+
+def main() -> int:
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, "plans.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(engine, "connect", configure_sqlite_connection)
+    event.listen(async_engine.sync_engine, "connect", configure_sqlite_connection)
+    Session = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db():
+        async with Session() as db:
+            yield db
+
+    statements = {}
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.setdefault(statement, parameters)
+
+    # reads that open their own sessions, such as streamed exports, get them from read_sessionmaker
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[read_sessionmaker] = lambda: Session
+    try:
+        exercise(TestClient(app))
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        app.dependency_overrides.pop(read_sessionmaker, None)
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+    tables = set(Base.metadata.tables)
+    failures = 0
+    with engine.connect() as conn:
+        for statement, parameters in statements.items():
+            plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            details = [row[3] for row in plan]
+            statement = " ".join(statement.split())
+            problems = plan_problems(statement, details, tables)
+            expected = next((reason for pattern, reason in EXPECTED if pattern.search(statement)), None)
+            if problems and expected:
+                status = f"ok, {expected}"
+            else:
+                status = ", ".join(problems) or "ok"
+                failures += bool(problems)
+            print(f"[{status}] {statement}")
+            for detail in details:
+                print(f"    {detail}")
+
+    print(f"\n{len(statements)} statements checked, {failures} with full scans or sorts")
+    return 1 if failures else 0
+
+
+def plan_problems(statement: str, details, tables) -> list:
+    problems = []
+    paginated = " LIMIT " in statement
+    for detail in details:
+        m = FULL_SCAN.match(detail)
+        # walking an index in ORDER BY order is bounded by the LIMIT; anything else reads every row
+        if m and m.group(1) in tables and not (paginated and " USING " in detail):
+            problems.append("FULL SCAN")
+    # a page sorted after the fact sorts every match, on every page; rows from the
+    # full-text and R*Tree virtual tables have no usable order, so those are exempt
+    if paginated and TEMP_SORT in details and not any("VIRTUAL TABLE" in d for d in details):
+        problems.append("SORTED PAGE")
+    return problems
+
+
+if __name__ == "__main__":
+    sys.exit(main())
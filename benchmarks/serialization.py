@@ -0,0 +1,123 @@
+"""Compare the cost of serializing one 100-item search page, before and after.
+
+"before" is the old list_shanyraks path: full ORM objects, a dict built per
+listing, FastAPI's jsonable_encoder and the stdlib JSONResponse. "after" is
+the current path: summary columns as row tuples, validated through the
+ListingSummary TypeAdapter and rendered by orjson. Each is timed with and
+without the fetch, against an in-memory database:
+
+    PYTHONPATH=/path/to/repo python -m benchmarks.serialization
+"""
+import argparse
+import json
+import statistics
+import sys
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.database import Base
+from app.responses import model_response
+from app.routers.listings import SUMMARY_COLUMNS
+
+PAGE_SIZE = 100
+
+
+def seed(session: Session) -> None:
+    session.add(models.User(id=1, username="bench@example.kz", password_hash="x"))
+    session.add_all(
+        models.Listing(
+            type="rent" if i % 2 else "sale", price=100000 + i, address=f"Abay {i}", area=54.5,
+            rooms_count=i % 4 + 1, description="Евроремонт", user_id=1, latitude=43.25, longitude=76.91,
+        )
+        for i in range(PAGE_SIZE)
+    )
+    session.commit()
+
+
+def fetch_before(session: Session):
+    return session.scalars(select(models.Listing).limit(PAGE_SIZE)).all()
+
+
+def render_before(listings) -> bytes:
+    objects = []
+    for lst in listings:
+        objects.append({
+            "_id": lst.id,
+            "type": lst.type,
+            "price": lst.price,
+            "address": lst.address,
+            "area": lst.area,
+            "rooms_count": lst.rooms_count,
+            "latitude": lst.latitude,
+            "longitude": lst.longitude,
+            "comments_count": lst.comments_count
+        })
+    return JSONResponse(jsonable_encoder({"total": len(objects), "objects": objects, "next_cursor": None})).body
+
+
+def fetch_after(session: Session):
+    return session.execute(select(*SUMMARY_COLUMNS).limit(PAGE_SIZE)).all()
+
+
+def render_after(rows) -> bytes:
+    page = schemas.ListingPage(
+        total=len(rows),
+        objects=schemas.listing_summaries.validate_python([row._asdict() for row in rows]),
+        next_cursor=None
+    )
+    return model_response(page).body
+
+
+def per_call_us(fn, number: int, repeat: int) -> float:
+    return statistics.median(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization")
+    parser.add_argument("--number", type=int, default=500, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs; the median is reported")
+    args = parser.parse_args(argv)
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        seed(session)
+
+    with Session(engine) as session:
+        listings, rows = fetch_before(session), fetch_after(session)
+        before_body, after_body = render_before(listings), render_after(rows)
+        # both paths must produce the same document
+        assert json.loads(before_body) == json.loads(after_body), "before and after payloads differ"
+
+        def before():
+            session.expunge_all()
+            return render_before(fetch_before(session))
+
+        def after():
+            return render_after(fetch_after(session))
+
+        results = {
+            "serialize only": (
+                per_call_us(lambda: render_before(listings), args.number, args.repeat),
+                per_call_us(lambda: render_after(rows), args.number, args.repeat),
+            ),
+            "fetch + serialize": (
+                per_call_us(before, args.number, args.repeat),
+                per_call_us(after, args.number, args.repeat),
+            ),
+        }
+
+    print(f"{PAGE_SIZE}-item page, median per call")
+    print(f"{'':<20}{'before':>12}{'after':>12}{'speedup':>10}")
+    for name, (before_us, after_us) in results.items():
+        print(f"{name:<20}{before_us:>10.0f}us{after_us:>10.0f}us{before_us / after_us:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+import httpx
+import pytest
+
+# imported before the app: it sets QUERY_BUDGET_MODE=raise and moves to a
+# scratch directory, so ./database.db is a throwaway database
+from benchmarks.query_budgets import Recorder
+
+from app.main import app
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def budget_client():
+    """An in-process client that counts each call's statements with count_queries(), per route."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://tests") as client:
+        yield Recorder(client)
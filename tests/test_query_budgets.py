@@ -0,0 +1,10 @@
+import pytest
+
+from benchmarks.query_budgets import budget_problems, exercise
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_every_route_within_budget(budget_client):
+    await exercise(budget_client)
+    assert budget_problems(budget_client) == []